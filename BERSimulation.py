@@ -0,0 +1,129 @@
+""" Monte Carlo bit error rate vs SNR simulation of the convolutional codes in ConvolutionalCodes
+    Each point of a sweep runs batches of random frames through encode -> AWGN channel -> Viterbi decode -> ber in
+    a pool of processes until enough bit errors have been counted, and the resulting BER curves (with the decoding
+    throughput) can be written out as CSV or JSON.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from ConvolutionalCodes import ConvolutionalEncoder, ViterbiDecoder, SoftViterbiDecoder, ber
+
+RESULT_FIELDS = ["K", "glist", "decoder", "snr_db", "sigma", "bits", "errors", "ber",
+                 "decode_seconds", "decode_bits_per_second"]
+
+
+def snr_to_sigma(snr_db):
+    """ :return the standard deviation of the gaussian noise for an SNR in dB
+        bits are sent as 0 and 1 volts and the noise power is taken to be 2 * sigma^2 (as in the soft decoding test in
+        ConvolutionalCodes), so SNR = 1 / (2 * sigma^2)
+    """
+    return (1 / (2 * 10 ** (snr_db / 10))) ** 0.5
+
+
+# decoders already built by this worker process, of the form {(K, glist, soft): decoder}
+_decoders = {}
+
+
+def _get_decoder(K, glist, soft):
+    key = (K, tuple(glist), soft)
+    if key not in _decoders:
+        _decoders[key] = (SoftViterbiDecoder if soft else ViterbiDecoder)(K, glist)
+    return _decoders[key]
+
+
+def simulate_batch(K, glist, soft, sigma, nframes, frame_bits, seed):
+    """ sends nframes random frames of frame_bits bits each through the encoder, an AWGN channel with noise sigma and
+        the (soft if soft else hard) Viterbi decoder
+        seed is anything numpy.random.default_rng accepts, so a batch is reproducible on its own
+        :return (number of bit errors, number of bits, seconds spent decoding)
+    """
+    rng = numpy.random.default_rng(seed)
+    messages = rng.integers(0, 2, (nframes, frame_bits))
+    encoder = ConvolutionalEncoder(K, glist)
+    sent = numpy.zeros((nframes, frame_bits * len(glist)), dtype=numpy.single)
+    for i, message in enumerate(messages):
+        encoder.reset()
+        sent[i] = encoder.encode(message)
+    received = sent + rng.normal(0, sigma, sent.shape)
+
+    decoder = _get_decoder(K, glist, soft)
+    start = time.perf_counter()
+    decoded = decoder.decode_batch(received)
+    decode_seconds = time.perf_counter() - start
+
+    nbits = messages.size
+    return round(ber(messages.reshape(-1), decoded.reshape(-1)) * nbits), nbits, decode_seconds
+
+
+def simulate(configs, snr_points, min_errors=100, max_bits=10 ** 7, frame_bits=1000, frames_per_batch=100,
+             processes=None, seed=0):
+    """ :return a list of result dicts (with keys RESULT_FIELDS), one per (config, SNR) pair
+        configs: iterable of (K, glist, soft) tuples, soft being True for the soft-decision decoder
+        snr_points: iterable of SNRs in dB, see snr_to_sigma
+        Each point runs batches (of frames_per_batch frames) in order until at least min_errors bit errors have been
+        counted or max_bits bits have been sent. They are run in waves of one batch per process, and the batches of a
+        wave after the one that met the stopping rule are thrown away.
+        Batch b of point p of config c is seeded from (seed, c, p, b), so the results do not depend on the number of
+        processes or on the order the workers finish in.
+    """
+    processes = processes or os.cpu_count()
+    snr_points = list(snr_points)
+    results = []
+    with ProcessPoolExecutor(processes) as pool:
+        for c, (K, glist, soft) in enumerate(configs):
+            for p, snr_db in enumerate(snr_points):
+                sigma = snr_to_sigma(snr_db)
+                errors = bits = 0
+                decode_seconds = 0.0
+                batch = 0
+                while errors < min_errors and bits < max_bits:
+                    seeds = [numpy.random.SeedSequence(seed, spawn_key=(c, p, b))
+                             for b in range(batch, batch + processes)]
+                    batch += processes
+                    wave = pool.map(simulate_batch, *zip(*[(K, glist, soft, sigma, frames_per_batch, frame_bits, s)
+                                                           for s in seeds]))
+                    for batch_errors, batch_bits, batch_seconds in wave:
+                        if errors >= min_errors or bits >= max_bits:
+                            break
+                        errors += batch_errors
+                        bits += batch_bits
+                        decode_seconds += batch_seconds
+
+                results.append({"K": K,
+                                "glist": " ".join(oct(g) for g in glist),
+                                "decoder": "soft" if soft else "hard",
+                                "snr_db": snr_db,
+                                "sigma": sigma,
+                                "bits": bits,
+                                "errors": errors,
+                                "ber": errors / bits,
+                                "decode_seconds": decode_seconds,
+                                # per process, since the decode time is summed over the workers
+                                "decode_bits_per_second": bits / decode_seconds})
+                print(f"K={K} glist={results[-1]['glist']} {results[-1]['decoder']} SNR={snr_db}dB: "
+                      f"BER {errors / bits:.3g} ({errors} errors in {bits} bits)")
+    return results
+
+
+def write_csv(results, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def write_json(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    results = simulate([(3, (7, 5), False), (3, (7, 5), True), (7, (0o171, 0o133), True)],
+                       numpy.arange(0, 7, 1.0), min_errors=100, max_bits=10 ** 6)
+    write_csv(results, "ber.csv")
+    write_json(results, "ber.json")
@@ -1,20 +1,12 @@
 # code started from template for MIT OCW 6.02, just converted from python 2.7 to 3.8
 
-import numpy, sys, operator
+import numpy, sys, os, time, random
+from concurrent.futures import ProcessPoolExecutor
+from parity import hamming, parity, popcount_array
 #import PS3_tests
 
-# compute hamming distance of two bit sequences
-def hamming(s1, s2):
-    return sum(map(operator.xor, s1, s2))
-
-
 # xor together all the bits in an integer
-def xorbits(n):
-    result = 0
-    while n > 0:
-        result ^= (n & 1)
-        n >>= 1
-    return result
+xorbits = parity
 
 
 def expected_parity(from_state, to_state, k, glist):
@@ -24,16 +16,76 @@ def expected_parity(from_state, to_state, k, glist):
     return [xorbits(g & x) for g in glist]
 
 
-def convolutional_encoder(bits, K, glist):
-    result = [0] * (len(bits) * len(glist))
-    state = 0
-    index = 0
-    for b in bits:
-        state = (b << (K - 1)) + (state >> 1)
-        for g in glist:
-            result[index] = xorbits(state & g)
-            index += 1
-    return numpy.array(result, dtype=numpy.single)
+# Encode the whole bit array at once, see ConvolutionalEncoder below.
+def convolutional_encoder(bits, K, glist, puncture=None):
+    return ConvolutionalEncoder(K, glist, puncture).encode(bits)
+
+
+# Puncturing patterns that raise a rate 1/2 mother code to a higher rate.
+# A pattern is an r x P table: parity bit j of message bit n is
+# transmitted when pattern[j][n % P] is 1 and dropped when it is 0.
+PUNCTURE_PATTERNS = {
+    "2/3": ((1, 1),
+            (1, 0)),
+    "3/4": ((1, 1, 0),
+            (1, 0, 1)),
+}
+
+
+# Drop the parity bits that pattern does not transmit from encoded, the
+# parity bits of consecutive message bits (r per message bit) starting
+# with message bit first_bit.
+def puncture(encoded, pattern, first_bit=0):
+    pattern = numpy.array(pattern, dtype=bool)
+    r, period = pattern.shape
+    nbits = len(encoded) // r
+    keep = pattern[:, (first_bit + numpy.arange(nbits)) % period].T
+    return numpy.asarray(encoded)[keep.reshape(-1)]
+
+
+class ConvolutionalEncoder:
+    # The encoder state is the last K bits of the message, so each parity
+    # stream is the message convolved (mod 2) with the taps of its
+    # generator: parity_g[n] = xor over d of tap_g[d] & x[n - d], where
+    # tap_g[d] is bit K-1-d of g.  encode() computes every parity stream
+    # of a chunk of bits with one convolution per generator, and keeps
+    # the last K-1 bits between calls so a long message can be encoded
+    # in chunks.  The output is the same as the bit-by-bit encoder's:
+    # the parity bits of each message bit in glist order, as an array of
+    # numpy.single.  With a puncturing pattern (see PUNCTURE_PATTERNS)
+    # the bits the pattern drops are left out of the output.
+    def __init__(self, K, glist, puncture=None):
+        self.K = K
+        self.glist = glist
+        self.puncture = puncture
+        self.taps = numpy.array([[(g >> (K - 1 - d)) & 1 for d in range(K)]
+                                 for g in glist], dtype=numpy.uint8)
+        self.reset()
+
+    # Go back to the all-zeros starting state.
+    def reset(self):
+        # last K-1 message bits, oldest first
+        self.history = numpy.zeros(self.K - 1, dtype=numpy.uint8)
+        # number of message bits encoded so far, which tells where in
+        # the puncturing pattern the next bit falls
+        self.nencoded = 0
+
+    def encode(self, bits):
+        bits = numpy.asarray(bits, dtype=numpy.uint8)
+        result = numpy.zeros((len(bits), len(self.glist)), dtype=numpy.single)
+        if len(bits) == 0:
+            return result.reshape(-1)
+
+        x = numpy.concatenate((self.history, bits))
+        for j, taps in enumerate(self.taps):
+            result[:, j] = numpy.convolve(x, taps, mode='valid') % 2
+        self.history = x[len(x) - (self.K - 1):]
+
+        result = result.reshape(-1)
+        if self.puncture is not None:
+            result = puncture(result, self.puncture, self.nencoded)
+        self.nencoded += len(bits)
+        return result
 
 
 def ber(xmit, received):
@@ -41,6 +93,10 @@ def ber(xmit, received):
 
 
 class ViterbiDecoder:
+    # factor by which branch metrics are multiplied before being
+    # rounded to integers in decode_compact()
+    metric_scale = 1
+
     # Given the constraint length and a list of parity generator
     # functions, do the initial set up for the decoder.  The
     # following useful instance variables are created:
@@ -49,7 +105,9 @@ class ViterbiDecoder:
     #   self.r
     #   self.predecessor_states
     #   self.expected_parity
-    def __init__(self, K, glist):
+    # puncture is an optional puncturing pattern (see PUNCTURE_PATTERNS)
+    # the received voltages were transmitted with.
+    def __init__(self, K, glist, puncture=None):
         self.K = K  # constraint length
         self.nstates = 2 ** (K - 1)  # number of states in state machine
 
@@ -79,6 +137,41 @@ class ViterbiDecoder:
               for s2 in range(self.nstates)]
              for s1 in range(self.nstates)]
 
+        # array versions of the two tables above, used to run a whole
+        # trellis column at once.  self.predecessors[s, i] is the i-th
+        # predecessor of state s, and self.branch_parity[s, i] is the
+        # r-element array of parity bits expected on the branch from
+        # self.predecessors[s, i] to s.
+        self.predecessors = numpy.array(self.predecessor_states,
+                                        dtype=numpy.intc)
+        self.branch_parity = numpy.array(
+            [[self.expected_parity[p][s] for p in self.predecessor_states[s]]
+             for s in range(self.nstates)], dtype=numpy.intc)
+
+        # the same parity bits packed into one r-bit integer per branch
+        # (first parity bit in the most significant position), and the
+        # hard-decision metric for every pair of r-bit patterns:
+        # self.metric_table[p, e] is the Hamming distance between the
+        # received pattern p and the expected pattern e.  A trellis
+        # column then costs a single table lookup, see branch_metrics().
+        self.pattern_weights = 1 << numpy.arange(self.r - 1, -1, -1)
+        self.branch_codes = self.branch_parity @ self.pattern_weights
+        patterns = numpy.arange(2 ** self.r)
+        self.metric_table = popcount_array(
+            patterns[:, None] ^ patterns[None, :]).astype(numpy.intc)
+
+        # with puncturing, trellis column n only has the parity bits
+        # self.puncture_kept[n % P] of the r, and starts at received
+        # voltage (n // P) * self.puncture_offsets[P] +
+        # self.puncture_offsets[n % P], where P is the pattern's period.
+        self.puncture = None
+        if puncture is not None:
+            self.puncture = numpy.array(puncture, dtype=bool)
+            self.puncture_kept = [numpy.flatnonzero(column)
+                                  for column in self.puncture.T]
+            self.puncture_offsets = numpy.concatenate(
+                ([0], numpy.cumsum(self.puncture.sum(axis=0))))
+
     # expected is an r-element list of the expected parity bits.
     # received is an r-element list of actual sampled voltages for the
     # incoming parity bits.  This is a hard-decision branch metric,
@@ -92,30 +185,81 @@ class ViterbiDecoder:
         recieved = [1 if v >= 0.5 else 0 for v in received]
         return hamming(expected, recieved)
 
+    # Array version of branch_metric: received is an array of r
+    # sampled voltages (or any array whose last axis has length r).
+    # Returns an array of shape received.shape[:-1] + (nstates, 2)
+    # holding the branch metric of every branch in the trellis column,
+    # entry [..., s, i] being the metric of the branch from
+    # self.predecessors[s, i] to s.  For a punctured column, kept lists
+    # which of the r parity bits were received; the erased ones add
+    # nothing to the metric.  They are masked out of the expected
+    # patterns, so the table lookup works the same way.
+    def branch_metrics(self, received, kept=None):
+        weights, codes = self.pattern_weights, self.branch_codes
+        if kept is not None:
+            weights = weights[kept]
+            codes = codes & weights.sum()
+        pattern = (numpy.asarray(received) >= 0.5) @ weights
+        return self.metric_table[pattern][..., codes]
+
+    # Given the path metrics pm of the previous trellis column (the
+    # last axis indexed by state) and the received voltages of this
+    # column (see trellis_columns() for kept), do the add-compare-select
+    # for all states at once.
+    # Returns (new path metrics, most-likely predecessor of each state).
+    # Ties go to the first predecessor, as in the lab write up.
+    def add_compare_select(self, pm, received, kept=None):
+        metrics = pm[..., self.predecessors] + \
+            self.branch_metrics(received, kept)
+        choice = metrics[..., 1] < metrics[..., 0]
+        return (numpy.where(choice, metrics[..., 1], metrics[..., 0]),
+                numpy.where(choice, self.predecessors[:, 1],
+                            self.predecessors[:, 0]))
+
     # Compute self.PM[...,n] from the batch of r parity bits and the
     # path metrics for self.PM[...,n-1] computed on the previous
     # iteration.  Consult the method described in the lab write up.
     # In addition to making an entry for self.PM[s,n] for each state
     # s, keep track of the most-likely predecessor for each state in
     # the self.Predecessor array (a two-dimensional array indexed by s
-    # and n).  You'll probably find the following instance variables
-    # and methods useful: self.predecessor_states, self.expected_parity,
-    # and self.branch_metric().  To see what these mean, scan through the
-    # code above.
-    def viterbi_step(self, n, received_voltages):
-        for state in range(self.nstates):
-            # compute the Path Metric from both incoming branches
-            pm0 = self.PM[self.predecessor_states[state][0]][n - 1] + \
-                  self.branch_metric(self.expected_parity[self.predecessor_states[state][0]][state], received_voltages)
-            pm1 = self.PM[self.predecessor_states[state][1]][n - 1] + \
-                  self.branch_metric(self.expected_parity[self.predecessor_states[state][1]][state], received_voltages)
-
-            if pm1 < pm0:
-                self.Predecessor[state][n] = self.predecessor_states[state][1]
-                self.PM[state][n] = pm1
-            else:
-                self.Predecessor[state][n] = self.predecessor_states[state][0]
-                self.PM[state][n] = pm0
+    # and n).  The whole column is computed with array operations, see
+    # add_compare_select() above.
+    def viterbi_step(self, n, received_voltages, kept=None):
+        self.PM[:, n], self.Predecessor[:, n] = self.add_compare_select(
+            self.PM[:, n - 1], received_voltages, kept)
+
+    # The received parity bits of trellis column n (counting from 0):
+    # None when all r were transmitted, else the array of the indices
+    # (into glist) of the ones the puncturing pattern kept.
+    def column_kept(self, n):
+        if self.puncture is None:
+            return None
+        return self.puncture_kept[n % len(self.puncture_kept)]
+
+    # Index of the first received voltage of trellis column n.
+    def column_offset(self, n):
+        if self.puncture is None:
+            return n * self.r
+        period = len(self.puncture_kept)
+        return (n // period) * self.puncture_offsets[period] + \
+            self.puncture_offsets[n % period]
+
+    # Number of complete trellis columns in nreceived voltages.
+    def column_count(self, nreceived):
+        if self.puncture is None:
+            return nreceived // self.r
+        period = len(self.puncture_kept)
+        periods, rest = divmod(nreceived, self.puncture_offsets[period])
+        return periods * period + \
+            numpy.searchsorted(self.puncture_offsets, rest, 'right') - 1
+
+    # Iterate over the trellis columns of nreceived voltages, yielding
+    # (start, end, kept) for each: the column's voltages are
+    # received_voltages[start:end], and kept is column_kept().
+    def trellis_columns(self, nreceived):
+        for n in range(self.column_count(nreceived)):
+            yield self.column_offset(n), self.column_offset(n + 1), \
+                self.column_kept(n)
 
     # Identify the most-likely ending state of the encoder by
     # finding the state s that has the minimum value of PM[s,n]
@@ -123,11 +267,7 @@ class ViterbiDecoder:
     # are several states with the same minimum value, choose one
     # arbitrarily.  Return the state s.
     def most_likely_state(self, n):
-        min_state = 0
-        for state in range(self.nstates):
-            if self.PM[state][n] < self.PM[min_state][n]:
-                min_state = state
-        return min_state
+        return int(numpy.argmin(self.PM[:, n]))
 
     # Starting at state s at time n, use the Predecessor
     # array to find all the states on the most-likely
@@ -153,12 +293,26 @@ class ViterbiDecoder:
             rev_message.pop(0)
         return rev_message
 
+    # Leave the trellis of the last decode() out when pickling a
+    # decoder, e.g. to ship it to worker processes (see
+    # parallel_decode() below); it is rebuilt by the next decode().
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('PM', None)
+        state.pop('Predecessor', None)
+        return state
+
     # Figure out what the transmitter sent from info in the
-    # received voltages.
-    def decode(self, received_voltages, debug=False):
+    # received voltages.  The encoder is assumed to start in
+    # start_state (the all-zeros state, as convolutional_encoder()
+    # does); pass start_state=None when decoding from the middle of a
+    # stream, where every starting state is equally likely.
+    def decode(self, received_voltages, debug=False, start_state=0):
+        received_voltages = numpy.asarray(received_voltages)
+
         # figure out how many columns are in the trellis
         nreceived = len(received_voltages)
-        max_n = int((nreceived / self.r) + 1)
+        max_n = self.column_count(nreceived) + 1
 
         # this is the path metric trellis itself, organized as a
         # 2D array: rows are the states, columns are the time points.
@@ -168,7 +322,9 @@ class ViterbiDecoder:
 
         # at time 0, the starting state is the most likely, the other
         # states are "infinitely" worse.
-        self.PM[1:self.nstates, 0] = 1000000
+        if start_state is not None:
+            self.PM[:, 0] = 1000000
+            self.PM[start_state, 0] = 0
 
         # a 2D array: rows are the states, columns are the time
         # points, contents indicate the predecessor state for each
@@ -179,12 +335,12 @@ class ViterbiDecoder:
         # use the Viterbi algorithm to compute PM
         # incrementally from the received parity bits.
         n = 0
-        for i in range(0, nreceived, self.r):
+        for start, end, kept in self.trellis_columns(nreceived):
             n += 1
 
             # Fill in the next columns of PM, Predecessor based
             # on info in the next r incoming parity bits
-            self.viterbi_step(n, received_voltages[i:i + self.r])
+            self.viterbi_step(n, received_voltages[start:end], kept)
 
             # print out what was just added to the trellis state
 
@@ -212,12 +368,101 @@ class ViterbiDecoder:
         # back through the matrix using self.Predecessor.
         return self.traceback(s, n)
 
+    # Decode many independent frames at once.  received_matrix is an
+    # (n_frames x n_symbols) array, one frame of received voltages per
+    # row, with n_symbols a multiple of r.  The trellis columns of all
+    # frames are computed together, with the path metrics held as an
+    # (n_frames x nstates) array, so the per-column Python overhead is
+    # paid once per batch rather than once per frame.  Returns an
+    # (n_frames x n_bits) array of decoded bits, row f being what
+    # decode(received_matrix[f]) returns.
+    def decode_batch(self, received_matrix):
+        received_matrix = numpy.asarray(received_matrix)
+        nframes, nreceived = received_matrix.shape
+        nbits = self.column_count(nreceived)
+        frames = numpy.arange(nframes)
+
+        # same initial conditions as decode(), for every frame
+        PM = numpy.zeros((nframes, self.nstates), dtype=numpy.single)
+        PM[:, 1:self.nstates] = 1000000
+
+        # Predecessor[n - 1, f, s] is the predecessor of state s at
+        # column n of frame f
+        Predecessor = numpy.zeros((nbits, nframes, self.nstates),
+                                  dtype=numpy.intc)
+        for n, (start, end, kept) in enumerate(
+                self.trellis_columns(nreceived)):
+            PM[:], Predecessor[n] = self.add_compare_select(
+                PM, received_matrix[:, start:end], kept)
+
+        # trace back all frames together from their most-likely final
+        # states; the message bit of a column is the most significant
+        # bit of the state the path goes through
+        message = numpy.zeros((nframes, nbits), dtype=numpy.uint8)
+        s = numpy.argmin(PM, axis=1)
+        for n in range(nbits - 1, -1, -1):
+            message[:, n] = (s >> (self.K - 2)) & 1
+            s = Predecessor[n, frames, s]
+        return message
+
+    # Memory-compact version of decode() for long frames and large K.
+    # Path metrics are held in a small integer dtype (metric_dtype, int16
+    # by default, or int8): branch metrics are quantized to integers by
+    # multiplying them by metric_scale (see the class attribute below)
+    # and each column is renormalized by subtracting its minimum, so
+    # the metrics stay within a few branch metrics of each other and
+    # anything larger saturates at the top of the dtype.  Only the
+    # newest column of path metrics is kept.  Survivors are recorded as
+    # one decision bit per state per column, which of the two
+    # predecessors won, packed 8 to a byte in self.Decisions
+    # (an n_bits x nstates/8 array of uint8), instead of as full
+    # predecessor states.  The hard decoder's metrics are already
+    # integers, so its output is the same as decode()'s.
+    def decode_compact(self, received_voltages, metric_dtype=numpy.int16,
+                       metric_scale=None):
+        received_voltages = numpy.asarray(received_voltages)
+        nbits = self.column_count(len(received_voltages))
+        if metric_scale is None:
+            metric_scale = self.metric_scale
+        # unreachable states start at the top of the dtype, and no single
+        # branch metric may reach more than half of it
+        limit = int(numpy.iinfo(metric_dtype).max)
+
+        PM = numpy.full(self.nstates, limit, dtype=metric_dtype)
+        PM[0] = 0
+        self.Decisions = numpy.zeros((nbits, (self.nstates + 7) // 8),
+                                     dtype=numpy.uint8)
+
+        for n, (start, end, kept) in enumerate(
+                self.trellis_columns(len(received_voltages))):
+            bm = self.branch_metrics(received_voltages[start:end], kept)
+            bm = numpy.minimum(numpy.rint(bm * metric_scale), limit // 2)
+            metrics = PM[self.predecessors].astype(numpy.intc) + \
+                bm.astype(numpy.intc)
+            choice = metrics[:, 1] < metrics[:, 0]
+            column = numpy.where(choice, metrics[:, 1], metrics[:, 0])
+            PM[:] = numpy.minimum(column - column.min(), limit)
+            self.Decisions[n] = numpy.packbits(choice)
+
+        # trace back: the winning predecessor of s is (2 * s + bit) mod
+        # nstates, bit being the decision recorded for s
+        message = [0] * nbits
+        s = int(numpy.argmin(PM))
+        for n in range(nbits - 1, -1, -1):
+            message[n] = (s >> (self.K - 2)) & 1
+            bit = (self.Decisions[n, s >> 3] >> (7 - (s & 7))) & 1
+            s = (2 * s + int(bit)) % self.nstates
+        return message
+
     # print out final path metrics
     def dump_state(self):
         print(self.PM[:, -1])
 
 
 class SoftViterbiDecoder(ViterbiDecoder):
+    # soft metrics are quantized to eighths of a squared volt
+    metric_scale = 8
+
     # Override the default branch metric with a soft decision metric:
     # the square of the Euclidian distance between the
     # expected and received voltages.
@@ -227,6 +472,262 @@ class SoftViterbiDecoder(ViterbiDecoder):
             bm += (expected[i] - received[i]) ** 2
         return bm
 
+    # Array version of the soft decision metric.  The expected bits are
+    # converted to the dtype of the received voltages so the sums are
+    # done at the same precision as branch_metric() does them.
+    def branch_metrics(self, received, kept=None):
+        received = numpy.asarray(received)
+        expected = self.branch_parity
+        if kept is not None:
+            expected = expected[..., kept]
+        if received.dtype.kind == 'f':
+            expected = expected.astype(received.dtype)
+        return numpy.sum((expected - received[..., None, None, :]) ** 2,
+                         axis=-1)
+
+
+class StreamingViterbiDecoder:
+    # Decode a continuous stream of received voltages that arrives in
+    # chunks of any length.  decoder is a ViterbiDecoder (or
+    # SoftViterbiDecoder), which supplies the trellis and the branch
+    # metrics.  Only the survivors of the last 2 * depth trellis columns
+    # are kept: whenever the window fills up, we trace back from the
+    # currently most-likely state and decide the oldest depth bits,
+    # which by then are at least depth columns behind the newest one.
+    # Memory is O(nstates * depth) no matter how long the stream is.  The
+    # decided bits converge to the ones decode() would return for the
+    # whole frame as depth grows: the default of 5 * K is the usual
+    # truncation depth, at which they nearly always agree, but on noisy
+    # input a few bits can still differ from decode() (and punctured
+    # codes need a deeper window).
+    def __init__(self, decoder, depth=None):
+        self.decoder = decoder
+        self.depth = 5 * decoder.K if depth is None else depth
+        self.reset()
+
+    # Start a new stream in the all-zeros state.
+    def reset(self):
+        nstates = self.decoder.nstates
+        # path metrics of the newest column, same conventions as decode()
+        self.PM = numpy.zeros(nstates, dtype=numpy.single)
+        self.PM[1:nstates] = 1000000
+        # Predecessor[:, t] are the survivors of the t-th column in the
+        # window, and ncolumns is how many columns the window holds
+        self.Predecessor = numpy.zeros((nstates, 2 * self.depth),
+                                       dtype=numpy.intc)
+        self.ncolumns = 0
+        # number of trellis columns since the start of the stream
+        self.column = 0
+        # voltages of an incomplete trellis column
+        self.pending = numpy.zeros(0)
+
+    # Trace back from the most-likely state of the newest column and
+    # return the message bits of the columns in the window, oldest first.
+    # The message bit of a column is the newest bit of its state, the
+    # most significant of the K-1 state bits.
+    def traceback(self):
+        s = int(numpy.argmin(self.PM))
+        states = numpy.zeros(self.ncolumns, dtype=numpy.intc)
+        for t in range(self.ncolumns - 1, -1, -1):
+            states[t] = s
+            s = self.Predecessor[s, t]
+        return (states >> (self.decoder.K - 2)) & 1
+
+    # Run the received voltages in chunk through the trellis, yielding
+    # message bits as soon as they are decided.
+    def feed(self, chunk):
+        received = numpy.asarray(chunk)
+        if len(self.pending):
+            received = numpy.concatenate((self.pending, received))
+        start = 0
+        while True:
+            kept = self.decoder.column_kept(self.column)
+            end = start + (self.decoder.r if kept is None else len(kept))
+            if end > len(received):
+                break
+            self.PM[:], self.Predecessor[:, self.ncolumns] = \
+                self.decoder.add_compare_select(self.PM,
+                                                received[start:end], kept)
+            self.ncolumns += 1
+            self.column += 1
+            start = end
+
+            if self.ncolumns == 2 * self.depth:
+                yield from self.traceback()[:self.depth].tolist()
+                # slide the window and keep the metrics from growing
+                # without bound
+                self.Predecessor[:, :self.depth] = \
+                    self.Predecessor[:, self.depth:]
+                self.ncolumns = self.depth
+                self.PM -= self.PM.min()
+
+        self.pending = received[start:]
+
+    # End of the stream: decide the bits still in the window, tracing
+    # back from the most-likely final state like decode() does.
+    def flush(self):
+        yield from self.traceback().tolist()
+        self.reset()
+
+    # Decode an iterable of chunks, yielding the whole message.
+    def decode(self, chunks):
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.flush()
+
+
+# decoder used by the worker processes of parallel_decode(), set once
+# per worker by _init_worker() so it is pickled once per worker rather
+# than once per segment
+_worker_decoder = None
+
+
+def _init_worker(decoder):
+    global _worker_decoder
+    _worker_decoder = decoder
+
+
+def _decode_segment(received_voltages, start_state):
+    return _worker_decoder.decode(received_voltages, start_state=start_state)
+
+
+# Decode received_voltages with decoder (a ViterbiDecoder or
+# SoftViterbiDecoder) in a pool of processes.  The message is split into
+# nsegments runs of consecutive bits (one per process by default), and
+# each run is decoded together with margin extra bits (5 * K by default)
+# on both sides: the leading margin lets the path metrics warm up from
+# an unknown starting state, and the trailing margin lets the survivor
+# paths merge before the run's own bits are traced back.  Neighbouring
+# segments thus overlap by 2 * margin bits and the outputs are joined
+# at the midpoint of each overlap.  With a margin of a few constraint
+# lengths the result is the same as decoder.decode(received_voltages).
+def parallel_decode(decoder, received_voltages, processes=None, nsegments=None,
+                    margin=None):
+    received_voltages = numpy.asarray(received_voltages)
+    processes = processes or os.cpu_count()
+    nsegments = nsegments or processes
+    margin = 5 * decoder.K if margin is None else margin
+    nbits = decoder.column_count(len(received_voltages))
+    # decode() starts at the beginning of the puncturing pattern, so
+    # punctured segments have to start on a multiple of its period
+    period = 1 if decoder.puncture is None else len(decoder.puncture_kept)
+
+    # segment j decodes bits [bounds[j], bounds[j + 1]) of the message
+    bounds = numpy.linspace(0, nbits, nsegments + 1).astype(int)
+    starts = [max(0, b - margin) // period * period for b in bounds[:-1]]
+    ends = [min(nbits, b + margin) for b in bounds[1:]]
+
+    pieces = [received_voltages[decoder.column_offset(start):
+                                decoder.column_offset(end)]
+              for start, end in zip(starts, ends)]
+    # only the first segment knows the encoder starts in the all-zeros
+    # state
+    start_states = [0] + [None] * (nsegments - 1)
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(decoder,)) as pool:
+        segments = pool.map(_decode_segment, pieces, start_states)
+        message = []
+        for j, segment in enumerate(segments):
+            offset = bounds[j] - starts[j]
+            message += segment[offset: offset + bounds[j + 1] - bounds[j]]
+
+    return message
+
+
+# Time parallel_decode() on a noise-free message of nbits for each
+# number of processes in process_counts, checking that every run
+# decodes the message exactly like the serial decoder.  Returns a dict
+# of the form {processes: seconds}.
+def benchmark_parallel_decode(K=7, glist=(0o171, 0o133), nbits=200000,
+                              process_counts=(1, 2, 4, 8),
+                              decoder=SoftViterbiDecoder):
+    d = decoder(K, glist)
+    message = numpy.random.randint(0, 2, nbits)
+    received = convolutional_encoder(message, K, glist)
+
+    start = time.perf_counter()
+    serial = d.decode(received)
+    serial_time = time.perf_counter() - start
+    assert numpy.array_equal(serial, message)
+    print(f"serial: {serial_time:.2f}s "
+          f"({nbits / serial_time / 1000:.1f} kbit/s)")
+
+    times = {}
+    for processes in process_counts:
+        start = time.perf_counter()
+        decoded = parallel_decode(d, received, processes)
+        times[processes] = time.perf_counter() - start
+        assert decoded == serial, \
+            f"parallel decoding with {processes} processes differs " \
+            "from the serial decoder"
+        print(f"{processes} processes: {times[processes]:.2f}s, "
+              f"speedup {serial_time / times[processes]:.2f}x")
+
+    return times
+
+
+# Split the array x into a random number of consecutive chunks (some of
+# them possibly empty).
+def _random_chunks(x):
+    cuts = sorted(random.randint(0, len(x))
+                  for i in range(random.randint(0, 5)))
+    return [x[a:b] for a, b in zip([0] + cuts, cuts + [len(x)])]
+
+
+# Check the encoders and decoders against each other on random messages
+# of random lengths, for unpunctured codes and every pattern in
+# PUNCTURE_PATTERNS (with lengths that are not a multiple of the
+# pattern's period): the chunked ConvolutionalEncoder must match
+# PS3_tests.convolutional_encoder (punctured by puncture()), decode(),
+# decode_batch(), decode_compact() (hard decoder) and
+# StreamingViterbiDecoder must all return the message from the
+# noise-free encoding, and each row of decode_batch() must be what
+# decode() returns for that row on noisy input.  Returns True if
+# everything matched.
+def random_test_convolutional(num_tests=20, max_bits=200, sigma=0.4):
+    import PS3_tests
+    codes = [(3, (7, 5)), (4, (0o17, 0o13)), (7, (0o171, 0o133))]
+    patterns = [None] + list(PUNCTURE_PATTERNS.values())
+    for case in range(num_tests):
+        K, glist = random.choice(codes)
+        pattern = random.choice(patterns)
+        nbits = random.randint(1, max_bits)
+        if pattern is not None and nbits % len(pattern[0]) == 0:
+            nbits += 1
+        message = numpy.random.randint(0, 2, nbits)
+        expected = message.tolist()
+
+        reference = PS3_tests.convolutional_encoder(message, K, glist)
+        if pattern is not None:
+            reference = puncture(reference, pattern)
+        encoder = ConvolutionalEncoder(K, glist, pattern)
+        encoded = numpy.concatenate(
+            [encoder.encode(chunk) for chunk in _random_chunks(message)])
+        if not numpy.array_equal(encoded, reference):
+            return False
+
+        hard = ViterbiDecoder(K, glist, pattern)
+        soft = SoftViterbiDecoder(K, glist, pattern)
+        if hard.decode_compact(encoded) != expected:
+            return False
+        for decoder in (hard, soft):
+            if list(decoder.decode(encoded)) != expected:
+                return False
+            if decoder.decode_batch(encoded[None])[0].tolist() != expected:
+                return False
+            stream = StreamingViterbiDecoder(decoder)
+            if list(stream.decode(_random_chunks(encoded))) != expected:
+                return False
+
+        noisy = encoded + numpy.random.normal(0, sigma, (3, len(encoded)))
+        for decoder, received in ((hard, (noisy > 0.5) * 1.0),
+                                  (soft, noisy)):
+            rows = decoder.decode_batch(received)
+            for row, frame in zip(rows, received):
+                if row.tolist() != list(decoder.decode(frame)):
+                    return False
+    return True
+
 
 if __name__ == '__main__':
     '''constraint_len = 3; glist = (7,5,3)
@@ -1,5 +1,28 @@
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 TABLE_SIZE = 2**8
 
+# byte mode (compress_bytes / decompress_bytes): codes 0-255 are the single bytes, CLEAR_CODE tells the decompressor to
+# start over with a fresh table and the strings added to the table get codes from FIRST_CODE on
+CLEAR_CODE = 256
+FIRST_CODE = 257
+MIN_BITS = 9
+MAX_BITS = 24
+# once the table is full, the compression ratio is checked every CHECK_INTERVAL input bytes, and the table cleared if
+# it got worse
+CHECK_INTERVAL = 10000
+
+# chunked container (compress_parallel): CONTAINER_MAGIC, the number of chunks, then for each chunk its uncompressed
+# length, the offset of its compressed stream from the start of the container and the length of that stream, then the
+# compressed streams, all integers little endian
+CONTAINER_MAGIC = b"LZWC"
+CONTAINER_HEADER = struct.Struct("<4sI")
+CONTAINER_ENTRY = struct.Struct("<QQQ")
+
 
 def init_table():
     """returns a list with the lowercase alphabet letters and space as entries"""
@@ -8,40 +31,513 @@ def init_table():
 
 
 def compress(text):
-    """ :return list of int indices of compression table that correspond with text symbols """
+    """ :return list of int indices of compression table that correspond with text symbols
+        the table is a dict from (code of a string, next symbol) to the code of the longer string, so each symbol costs
+        one dict lookup, and strings are never built
+        once the table has more than TABLE_SIZE entries it starts over from init_table
+    """
     c_text = []
-    table = init_table()
-    string = ""
+    symbols = {symbol: code for code, symbol in enumerate(init_table())}
+    table = {}
+    size = len(symbols)
+    code = None  # code of the string read so far (None if empty)
     for symbol in text:
-        if string + symbol in table:
-            string += symbol
+        if symbol not in symbols:
+            raise ValueError(f"{symbol!r} is not in the LZW alphabet")
+        if code is None:
+            code = symbols[symbol]
+            continue
+
+        next_code = table.get((code, symbol))
+        if next_code is not None:
+            code = next_code
         else:
-            c_text.append(table.index(string))
-            if len(table) > TABLE_SIZE:
-                table = init_table()
-            table.append(string + symbol)
-            string = symbol
-    c_text.append(table.index(string))
+            c_text.append(code)
+            if size > TABLE_SIZE:
+                table = {}
+                size = len(symbols)
+            else:
+                table[(code, symbol)] = size
+                size += 1
+            code = symbols[symbol]
+
+    if code is not None:
+        c_text.append(code)
 
     return c_text
 
 
 def decompress(compressed_text):
+    """ :return the text that compress turned into compressed_text
+        the table is held as arrays indexed by code: the code of the entry without its last symbol (-1 for single
+        symbols), its last symbol, and its first symbol, so each entry is added in constant time
+    """
+    alphabet = init_table()
+    prefix = [-1] * (TABLE_SIZE + 2)
+    last = alphabet + [None] * (TABLE_SIZE + 2 - len(alphabet))
+    first = last.copy()
+    size = len(alphabet)
+
     text = []
-    table = init_table()
-    string = table[compressed_text[0]]
+    previous = None  # the previous code, if the compressor added an entry after it
     for code in compressed_text:
-        if len(table) <= code:
-            entry = string + string[0]
-        else:
-            entry = table[code]
-        text.append(entry)
-        if len(table) > TABLE_SIZE:
-            table = init_table()
-        table.append(string + entry[0])
-        string = entry
+        if previous is not None and size > TABLE_SIZE:
+            # the compressor started a new table instead of adding an entry
+            size = len(alphabet)
+            previous = None
+
+        if previous is not None:
+            # the compressor added the previous string plus the first symbol of this one, which is the previous
+            # string's own first symbol if this code is the entry being added
+            prefix[size] = previous
+            last[size] = first[code] if code < size else first[previous]
+            first[size] = first[previous]
+            size += 1
+
+        entry = []
+        c = code
+        while c >= 0:
+            entry.append(last[c])
+            c = prefix[c]
+        text.extend(reversed(entry))
+        previous = code
 
     return "".join(text)
 
+
+def random_test_lzw(num_tests=100, length=3000):
+    """ checks that random texts (and some that repeat a symbol, which makes compress send the code it is adding) over
+        small alphabets come back from compress and decompress unchanged, with texts long enough to fill the table
+    """
+    # long enough that the table is started over a few times
+    long_text = "".join(random.choice("abcdefghijklmnopqrstuvwxyz ") for pos in range(10 * length))
+    texts = ["", "a", "aa", "aaa", "a" * 1000, "abababab", "ab" * 1000, long_text]
+    for case in range(num_tests):
+        alphabet = random.choice(["a", "ab", "ab ", "abcdefghijklmnopqrstuvwxyz "])
+        texts.append("".join(random.choice(alphabet) for pos in range(random.randint(0, length))))
+
+    for text in texts:
+        if decompress(compress(text)) != text:
+            return False
+    return len(compress(long_text)) > TABLE_SIZE
+
+
+def code_width(next_code, max_bits):
+    """ :return the number of bits each code is written with while the codes up to next_code - 1 are in use """
+    return min(max(MIN_BITS, (next_code - 1).bit_length()), max_bits)
+
+
+class LZWCompressor:
+    """ incremental compress_bytes: feed it the input a chunk at a time and it returns the compressed bytes ready so
+        far, keeping the table (at most 2**max_bits entries) and the bits of an unfinished byte between chunks
+    """
+
+    def __init__(self, max_bits=16, clear_on_full=False, check_interval=CHECK_INTERVAL):
+        if not MIN_BITS <= max_bits <= MAX_BITS:
+            raise ValueError(f"max_bits must be from {MIN_BITS} to {MAX_BITS}, not {max_bits}")
+        self.max_bits = max_bits
+        self.clear_on_full = clear_on_full
+        self.check_interval = check_interval
+        self.reset()
+
+    def reset(self):
+        """ starts a new stream (with its own header) """
+        self.table = {}
+        self.next_code = FIRST_CODE
+        self.width = code_width(self.next_code, self.max_bits)
+        self.code = None  # code of the string read so far (None if nothing has been read since the last code)
+        self.acc = self.nbits = 0  # bits not yet returned
+        self.header = bytes([self.max_bits])
+        self.nread = 0  # number of input bytes so far
+        self.nwritten = 8  # number of output bits so far, returned or not
+        self.start = self.start_bits = 0  # nread and nwritten when the current table was started
+        self.checkpoint = 0  # nread when to next check the ratio
+        self.best_ratio = 0
+
+    def feed(self, chunk):
+        """ :return the compressed bytes completed by the bytes-like chunk """
+        chunk = memoryview(chunk).cast("B")
+        out = bytearray(self.header)
+        self.header = b""
+
+        # the state lives in locals while the chunk is compressed
+        table, next_code, width, code = self.table, self.next_code, self.width, self.code
+        acc, nbits, nwritten = self.acc, self.nbits, self.nwritten
+        max_bits, limit = self.max_bits, 2 ** self.max_bits
+        for i, byte in enumerate(chunk, self.nread):
+            if code is None:
+                code = byte
+                continue
+
+            next_string = table.get((code, byte))
+            if next_string is not None:
+                code = next_string
+                continue
+
+            acc = (acc << width) | code
+            nbits += width
+            nwritten += width
+            while nbits >= 8:
+                nbits -= 8
+                out.append(acc >> nbits)
+                acc &= (1 << nbits) - 1
+
+            if next_code < limit:
+                table[(code, byte)] = next_code
+                next_code += 1
+                width = code_width(next_code, max_bits)
+            elif self.clear_on_full or i >= self.checkpoint:
+                self.checkpoint = i + self.check_interval
+                ratio = (i - self.start) / (nwritten - self.start_bits)
+                if self.clear_on_full or ratio < self.best_ratio:
+                    acc = (acc << width) | CLEAR_CODE
+                    nbits += width
+                    nwritten += width
+                    table = {}
+                    next_code = FIRST_CODE
+                    width = code_width(next_code, max_bits)
+                    self.start, self.start_bits = i, nwritten
+                    self.best_ratio = 0
+                else:
+                    self.best_ratio = ratio
+            code = byte
+
+        self.table, self.next_code, self.width, self.code = table, next_code, width, code
+        self.acc, self.nbits, self.nwritten = acc, nbits, nwritten
+        self.nread += len(chunk)
+        return bytes(out)
+
+    def flush(self):
+        """ :return the rest of the compressed stream: the code of the string read so far and the padding
+            the compressor is then reset, ready for a new stream
+        """
+        out = bytearray(self.header)
+        acc, nbits = self.acc, self.nbits
+        if self.code is not None:
+            acc = (acc << self.width) | self.code
+            nbits += self.width
+        while nbits >= 8:
+            nbits -= 8
+            out.append(acc >> nbits)
+            acc &= (1 << nbits) - 1
+        if nbits:
+            out.append(acc << (8 - nbits))
+        self.reset()
+        return bytes(out)
+
+
+class LZWDecompressor:
+    """ incremental decompress_bytes: feed it the compressed stream a chunk at a time and it returns the bytes decoded
+        so far, keeping the table and the bits of an unfinished code between chunks
+        as in decompress, the table is held as arrays of prefix code, last byte and first byte indexed by code
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ starts on a new stream (header first) """
+        self.max_bits = None
+        self.prefix = self.last = self.first = None
+        self.next_code = FIRST_CODE
+        self.previous = None  # the previous code, if the compressor added a string after it
+        self.acc = self.nbits = 0
+        self.width = MIN_BITS
+
+    def _read_header(self, max_bits):
+        if not MIN_BITS <= max_bits <= MAX_BITS:
+            raise ValueError(f"corrupt LZW data: max_bits is {max_bits}")
+        self.max_bits = max_bits
+        # the arrays grow as codes are added, up to 2**max_bits entries
+        self.prefix = [-1] * FIRST_CODE
+        self.last = list(range(256)) + [0]
+        self.first = self.last.copy()
+        self.width = code_width(self.next_code, max_bits)
+
+    def feed(self, chunk):
+        """ :return the bytes decoded from the compressed bytes-like chunk """
+        chunk = memoryview(chunk).cast("B")
+        if self.max_bits is None and len(chunk):
+            self._read_header(chunk[0])
+            chunk = chunk[1:]
+
+        out = bytearray()
+        prefix, last, first = self.prefix, self.last, self.first
+        next_code, previous, acc, nbits, width = self.next_code, self.previous, self.acc, self.nbits, self.width
+        max_bits = self.max_bits
+        limit = 2 ** max_bits if max_bits is not None else 0
+        for byte in chunk:
+            acc = (acc << 8) | byte
+            nbits += 8
+            while nbits >= width:
+                nbits -= width
+                code = acc >> nbits
+                acc &= (1 << nbits) - 1
+
+                if code == CLEAR_CODE:
+                    next_code = FIRST_CODE
+                    previous = None
+                elif previous is None:
+                    if code > 255:
+                        raise ValueError(f"corrupt LZW data: code {code} is not a byte")
+                    out.append(code)
+                    previous = code
+                else:
+                    if code > next_code:
+                        raise ValueError(f"corrupt LZW data: code {code} is not in the table")
+                    if next_code < limit:
+                        if next_code == len(prefix):
+                            prefix.append(-1)
+                            last.append(0)
+                            first.append(0)
+                        # as in decompress, a code equal to next_code is the entry being added here
+                        prefix[next_code] = previous
+                        last[next_code] = first[code] if code < next_code else first[previous]
+                        first[next_code] = first[previous]
+                        next_code += 1
+                    elif code == next_code:
+                        raise ValueError(f"corrupt LZW data: code {code} is not in the table")
+
+                    entry = bytearray()
+                    c = code
+                    while c >= 0:
+                        entry.append(last[c])
+                        c = prefix[c]
+                    entry.reverse()
+                    out += entry
+                    previous = code
+
+                # the compressor adds a string after every code but the first one after a clear
+                width = code_width(next_code + (previous is not None), max_bits)
+
+        self.next_code, self.previous, self.acc, self.nbits, self.width = next_code, previous, acc, nbits, width
+        return bytes(out)
+
+    def flush(self):
+        """ checks that the stream ended on a whole code (plus padding), and resets the decompressor for a new stream
+            :return b"", as everything has already been returned by feed
+        """
+        if self.max_bits is None:
+            raise ValueError("LZW data is missing its header")
+        if self.nbits >= 8:
+            raise ValueError("LZW data ends in the middle of a code")
+        self.reset()
+        return b""
+
+
+def compress_bytes(data, max_bits=16, clear_on_full=False, check_interval=CHECK_INTERVAL):
+    """ :return data (bytes-like) LZW compressed to bytes: one byte holding max_bits, then the codes packed most
+        significant bit first, each with code_width bits, and zero padding up to a whole byte
+        The codes grow from MIN_BITS to max_bits bits wide as the table fills up. Once it holds 2**max_bits codes no
+        more strings are added, and a CLEAR_CODE is written (and the table started over) right away if clear_on_full,
+        otherwise as soon as the compression ratio since the last clear drops, measured every check_interval bytes.
+    """
+    compressor = LZWCompressor(max_bits, clear_on_full, check_interval)
+    return compressor.feed(data) + compressor.flush()
+
+
+def decompress_bytes(data):
+    """ :return the bytes that compress_bytes turned into data """
+    decompressor = LZWDecompressor()
+    return decompressor.feed(data) + decompressor.flush()
+
+
+def _random_bytes(length):
+    """ random test data: uniform bytes, bytes from a small alphabet, or a repeated byte, in runs of random length """
+    data = bytearray()
+    while len(data) < length:
+        run = random.randint(1, length - len(data))
+        kind = random.randrange(3)
+        if kind == 0:
+            data += random.randbytes(run)
+        elif kind == 1:
+            data += bytes(random.choice(b"abc") for pos in range(run))
+        else:
+            data += bytes([random.randrange(256)]) * run
+    return bytes(data)
+
+
+def random_test_lzw_bytes(num_tests=20, length=20000):
+    """ checks that random data comes back from compress_bytes and decompress_bytes unchanged, for small and large
+        max_bits, clearing the table when it is full or when the ratio drops (checked often, so that it happens)
+    """
+    for case in range(num_tests):
+        data = _random_bytes(random.randint(0, length))
+        for max_bits in (MIN_BITS, 12, 16):
+            for clear_on_full in (False, True):
+                compressed = compress_bytes(data, max_bits, clear_on_full, check_interval=random.randint(1, 1000))
+                if decompress_bytes(compressed) != data:
+                    return False
+    return True
+
+
+def compress_stream(chunks, **kwargs):
+    """ generator of the compressed stream of the bytes-like chunks (see compress_bytes for kwargs), piece by piece
+        only the table and one chunk are held in memory at a time
+    """
+    compressor = LZWCompressor(**kwargs)
+    for chunk in chunks:
+        out = compressor.feed(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def decompress_stream(chunks):
+    """ generator of the bytes of the compressed stream given as bytes-like chunks, piece by piece """
+    decompressor = LZWDecompressor()
+    for chunk in chunks:
+        out = decompressor.feed(chunk)
+        if out:
+            yield out
+    decompressor.flush()
+
+
+def _read_chunks(f, chunk_size):
+    return iter(lambda: f.read(chunk_size), b"")
+
+
+def compress_file(src, dst, chunk_size=2**16, **kwargs):
+    """ compresses the binary file object src into the binary file object dst, chunk_size bytes at a time
+        :return the number of bytes written
+    """
+    return sum(dst.write(out) for out in compress_stream(_read_chunks(src, chunk_size), **kwargs))
+
+
+def decompress_file(src, dst, chunk_size=2**16):
+    """ decompresses the binary file object src into the binary file object dst, chunk_size bytes at a time
+        :return the number of bytes written
+    """
+    return sum(dst.write(out) for out in decompress_stream(_read_chunks(src, chunk_size)))
+
+
+def _random_chunks(data, max_chunk):
+    """ data cut into chunks of random length from 0 to max_chunk """
+    chunks = []
+    i = 0
+    while i < len(data):
+        size = random.randint(0, max_chunk)
+        chunks.append(data[i: i + size])
+        i += size
+    return chunks
+
+
+def random_test_lzw_stream(num_tests=20, length=20000):
+    """ checks that compress_stream gives the same bytes as compress_bytes and that decompress_stream gets the data
+        back, whatever chunks (including empty ones, and single bytes that end in the middle of a code) they are fed
+    """
+    for case in range(num_tests):
+        data = _random_bytes(random.randint(0, length))
+        kwargs = {"max_bits": random.choice([MIN_BITS, 12, 16]), "clear_on_full": random.random() < 0.5,
+                  "check_interval": random.randint(1, 1000)}
+        compressed = compress_bytes(data, **kwargs)
+        max_chunk = random.choice([1, 7, 1000])
+        if b"".join(compress_stream(_random_chunks(data, max_chunk), **kwargs)) != compressed:
+            return False
+        if b"".join(decompress_stream(_random_chunks(compressed, max_chunk))) != data:
+            return False
+    return True
+
+
+def compress_parallel(data, chunk_size=2**20, processes=None, **kwargs):
+    """ :return the container (see CONTAINER_MAGIC) of data (bytes-like) cut into chunks of chunk_size bytes, each
+        compressed on its own with compress_bytes (see it for kwargs) in a pool of processes
+        each chunk starts from a fresh table, so the chunks can be decompressed in parallel and one at a time
+    """
+    data = memoryview(data).cast("B")
+    chunks = [bytes(data[i: i + chunk_size]) for i in range(0, len(data), chunk_size)]
+    with ProcessPoolExecutor(processes) as pool:
+        streams = list(pool.map(partial(compress_bytes, **kwargs), chunks))
+
+    index = bytearray(CONTAINER_HEADER.pack(CONTAINER_MAGIC, len(chunks)))
+    offset = CONTAINER_HEADER.size + CONTAINER_ENTRY.size * len(chunks)
+    for chunk, stream in zip(chunks, streams):
+        index += CONTAINER_ENTRY.pack(len(chunk), offset, len(stream))
+        offset += len(stream)
+    return b"".join([index] + streams)
+
+
+def read_index(container):
+    """ :return the index of a container from compress_parallel, as a list of (uncompressed length, offset, length)
+        tuples, one per chunk
+    """
+    container = memoryview(container).cast("B")
+    if len(container) < CONTAINER_HEADER.size:
+        raise ValueError("LZW container is missing its header")
+    magic, nchunks = CONTAINER_HEADER.unpack_from(container)
+    if magic != CONTAINER_MAGIC:
+        raise ValueError(f"not an LZW container: magic is {magic!r}")
+    if len(container) < CONTAINER_HEADER.size + CONTAINER_ENTRY.size * nchunks:
+        raise ValueError("LZW container index is truncated")
+    index = [CONTAINER_ENTRY.unpack_from(container, CONTAINER_HEADER.size + CONTAINER_ENTRY.size * i)
+             for i in range(nchunks)]
+    for raw_length, offset, length in index:
+        if offset + length > len(container):
+            raise ValueError("LZW container is truncated")
+    return index
+
+
+def _decompress_chunk(container, entry):
+    raw_length, offset, length = entry
+    chunk = decompress_bytes(memoryview(container)[offset: offset + length])
+    if len(chunk) != raw_length:
+        raise ValueError(f"corrupt LZW container: chunk decompressed to {len(chunk)} bytes instead of {raw_length}")
+    return chunk
+
+
+def decompress_chunk(container, i):
+    """ :return chunk i of a container from compress_parallel, decompressing only that chunk """
+    return _decompress_chunk(container, read_index(container)[i])
+
+
+def decompress_parallel(container, processes=None):
+    """ :return all the data in a container from compress_parallel, the chunks decompressed in a pool of processes """
+    index = read_index(container)
+    streams = [bytes(memoryview(container)[offset: offset + length]) for raw_length, offset, length in index]
+    with ProcessPoolExecutor(processes) as pool:
+        chunks = list(pool.map(_decompress_chunk, streams, [(raw_length, 0, length)
+                                                             for raw_length, offset, length in index]))
+    return b"".join(chunks)
+
+
+def benchmark_parallel(data=None, chunk_sizes=(2**14, 2**16, 2**18, 2**20), processes=None, **kwargs):
+    """ compresses data (by default 4 MB of this file repeated) with compress_bytes and with compress_parallel at each
+        of chunk_sizes, and prints how much compression ratio the independent chunks cost against the throughput
+        gained
+        returns a dict of the form {chunk size (None for compress_bytes): (ratio, compress MB/s, decompress MB/s)}
+    """
+    if data is None:
+        with open(__file__, "rb") as f:
+            source = f.read()
+        data = source * (2**22 // len(source) + 1)
+    megabytes = len(data) / 2**20
+
+    def timed(function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        return result, megabytes / (time.perf_counter() - start)
+
+    results = {}
+    compressed, compress_rate = timed(partial(compress_bytes, **kwargs), data)
+    decompressed, decompress_rate = timed(decompress_bytes, compressed)
+    assert decompressed == data
+    results[None] = (len(data) / len(compressed), compress_rate, decompress_rate)
+    print(f"serial: ratio {results[None][0]:.3f}, compress {compress_rate:.2f} MB/s, "
+          f"decompress {decompress_rate:.2f} MB/s")
+
+    for chunk_size in chunk_sizes:
+        container, compress_rate = timed(partial(compress_parallel, chunk_size=chunk_size, processes=processes,
+                                                 **kwargs), data)
+        decompressed, decompress_rate = timed(partial(decompress_parallel, processes=processes), container)
+        assert decompressed == data, f"parallel round trip with {chunk_size} byte chunks differs"
+        results[chunk_size] = (len(data) / len(container), compress_rate, decompress_rate)
+        print(f"{chunk_size} byte chunks: ratio {results[chunk_size][0]:.3f} "
+              f"({results[chunk_size][0] / results[None][0] - 1:+.1%}), "
+              f"compress {compress_rate:.2f} MB/s ({compress_rate / results[None][1]:.2f}x), "
+              f"decompress {decompress_rate:.2f} MB/s ({decompress_rate / results[None][2]:.2f}x)")
+
+    return results
+
+
 if __name__ == '__main__':
-    print(decompress(compress("hello how are you")))
\ No newline at end of file
+    print(decompress(compress("hello how are you")))
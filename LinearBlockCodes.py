@@ -1,6 +1,15 @@
-import math
 import random
-from functools import reduce
+import time
+from functools import lru_cache
+
+import numpy
+
+from parity import parity_array, popcount_array
+
+# status of each block decoded by HammingCodec.decode_blocks or RectParityCodec.decode_blocks
+BLOCK_OK = 0  # no error found
+BLOCK_CORRECTED = 1  # a single error was found and corrected (possibly in a parity bit)
+BLOCK_DOUBLE_ERROR = 2  # more than one error was detected, the data is returned uncorrected
 
 
 def rect_parity_encode(data, num_rows, num_cols):
@@ -8,18 +17,7 @@ def rect_parity_encode(data, num_rows, num_cols):
         input data should be a list of 1s and 0s, of length num_rows * num_cols
     """
     assert len(data) == num_rows * num_cols
-    codeword = data.copy()
-    for row in range(num_rows):
-        # appends the row parity bit (the mod 2 sum of the elements in the row)
-        # could alternatively use functools.reduce(lambda i, j: i ^ j, data[row * num_cols]) for xor of all the elements
-        # we assume rows are sequential elements
-        codeword.append(sum(data[row * num_cols: (row + 1) * num_cols]) % 2)
-
-    for col in range(num_cols):
-        # similarly, appends the parity bit for the elements of the corresponding column
-        codeword.append(sum(data[col: num_cols * num_rows: num_cols]) % 2)
-
-    return codeword
+    return rect_parity_codec(num_rows, num_cols).encode_blocks(data)[0].tolist()
 
 
 def rect_parity_decode(codeword, num_rows, num_cols):
@@ -27,34 +25,83 @@ def rect_parity_decode(codeword, num_rows, num_cols):
         does not attempt to correct the data if it has multiple errors
         input codeword should be a list of size num_rows * num_cols + num_rows + num_cols containing 1s and 0s
     """
-    data = codeword[: num_cols * num_rows].copy()
-    row_parity_bits = codeword[num_cols * num_rows: num_cols * num_rows + num_rows]
-    col_parity_bits = codeword[num_cols * num_rows + num_rows: num_cols * num_rows + num_cols + num_rows]
-    row_error = -1
-    col_error = -1
-
-    # find the error
-    for row in range(num_rows):
-        # expression is 1 if parity error, 0 otherwise
-        if (sum(data[row * num_cols: (row + 1) * num_cols]) % 2) ^ row_parity_bits[row]:
-            if row_error >= 0:
-                # send the data as-is if a second row error is discovered
-                return data
-            row_error = row
-
-    for col in range(num_cols):
-        if (sum(data[col: num_cols * num_rows: num_cols]) % 2) ^ col_parity_bits[col]:
-            if col_error >= 0:
-                return data
-            col_error = col
-
-    # fix the error if one was found
-    if row_error >= 0 and col_error >= 0:
-        data[(num_cols * row_error) + col_error] ^= 1  # flip the bit at the location specified by the errors
-        return data
-    else:
-        # either was a parity bit error, or no error
-        return data
+    data, status = rect_parity_codec(num_rows, num_cols).decode_blocks(codeword)
+    return data[0].tolist()
+
+
+class RectParityCodec:
+    """ rectangular parity codec for blocks of num_rows * num_cols data bits, laid out row after row and followed by
+        the row parity bits and then the column parity bits (as by rect_parity_encode)
+        the parities of many blocks are computed at once, as sums along the axes of an (n_blocks x rows x cols) array
+    """
+    def __init__(self, num_rows, num_cols):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.data_size = num_rows * num_cols
+        self.block_size = self.data_size + num_rows + num_cols
+
+    def encode_blocks(self, data):
+        """ :return an array with one codeword per row, for data: an array of 1s and 0s that is reshaped to data_size
+            bits per row
+        """
+        data = numpy.asarray(data, dtype=numpy.uint8).reshape(-1, self.data_size)
+        grid = data.reshape(-1, self.num_rows, self.num_cols)
+        return numpy.concatenate((data, grid.sum(axis=2) % 2, grid.sum(axis=1) % 2), axis=1).astype(numpy.uint8)
+
+    def decode_blocks(self, codewords):
+        """ :return (data, status) for codewords, an array (or list) of 1s and 0s reshaped to one codeword per row
+            data holds the data bits of each codeword (one row per codeword), with single errors corrected,
+            and status holds BLOCK_OK, BLOCK_CORRECTED (a data or parity bit error) or BLOCK_DOUBLE_ERROR (more than
+            one error, the data is returned as received) for each codeword
+        """
+        codewords = numpy.asarray(codewords, dtype=numpy.uint8).reshape(-1, self.block_size)
+        grid = codewords[:, :self.data_size].reshape(-1, self.num_rows, self.num_cols).copy()
+        row_errors = (grid.sum(axis=2) + codewords[:, self.data_size: self.data_size + self.num_rows]) % 2
+        col_errors = (grid.sum(axis=1) + codewords[:, self.data_size + self.num_rows:]) % 2
+        num_row_errors = row_errors.sum(axis=1)
+        num_col_errors = col_errors.sum(axis=1)
+
+        # no parity errors means no error, a single row or column parity error means that parity bit is wrong,
+        # and one of each points at a data bit
+        status = numpy.full(len(codewords), BLOCK_DOUBLE_ERROR)
+        status[(num_row_errors == 0) & (num_col_errors == 0)] = BLOCK_OK
+        status[(num_row_errors + num_col_errors == 1)] = BLOCK_CORRECTED
+        fix = numpy.flatnonzero((num_row_errors == 1) & (num_col_errors == 1))
+        status[fix] = BLOCK_CORRECTED
+
+        # flip the data bit at the crossing of the row and column parity errors
+        grid[fix, row_errors[fix].argmax(axis=1), col_errors[fix].argmax(axis=1)] ^= 1
+        return grid.reshape(-1, self.data_size), status
+
+    def encode(self, data):
+        """ :return a flat uint8 array of the codewords of data (an array or list of 1s and 0s), which is padded with
+            zeros to a whole number of codewords
+        """
+        return self.encode_blocks(_pad_blocks(data, self.data_size)).reshape(-1)
+
+    def decode(self, message):
+        """ :return a flat uint8 array of the data in message (a whole number of codewords), correcting single errors
+        """
+        data, status = self.decode_blocks(message)
+        return data.reshape(-1)
+
+    def encode_bytes(self, buf):
+        """ :return the codewords of the bits of buf (bytes, bytearray, memoryview or uint8 array) packed into
+            bytes """
+        return bits_to_bytes(self.encode(bytes_to_bits(buf)))
+
+    def decode_bytes(self, buf, length=None):
+        """ :return (data, status) for buf, the output of encode_bytes, see HammingCodec.decode_bytes """
+        bits = bytes_to_bits(buf)
+        num_blocks = _num_blocks(len(bits), self.block_size, self.data_size, length)
+        data, status = self.decode_blocks(bits[: num_blocks * self.block_size])
+        return bits_to_bytes(data, length), status
+
+
+@lru_cache(maxsize=None)
+def rect_parity_codec(num_rows, num_cols):
+    """ :return the (shared) RectParityCodec for num_rows x num_cols blocks """
+    return RectParityCodec(num_rows, num_cols)
 
 
 def random_test_rect_parity(num_cols, num_rows, num_tests=100):
@@ -83,37 +130,54 @@ def random_test_rect_parity(num_cols, num_rows, num_tests=100):
 
 
 def random_test_hamming(block_size=16, num_tests=100):
-    side_length = round(block_size ** 0.5)
 
     def test_case(data):
         encoded = hamming_encode(data, block_size)
-        for i in range(side_length):
-            for j in range(side_length):
-                # flip the bit of encoded, see if we can decode, then flip it back
-                encoded[(side_length * i) + j] ^= 1
-                if hamming_decode(encoded, block_size) != data:
-                    return False
-                encoded[(side_length * i) + j] ^= 1
+        for i in range(block_size):
+            # flip the bit of encoded, see if we can decode, then flip it back
+            encoded[i] ^= 1
+            if hamming_decode(encoded, block_size) != data:
+                return False
+            encoded[i] ^= 1
 
         return True
 
     for case in range(num_tests):
         data = []
-        for pos in range(block_size - math.ceil(math.log2(block_size)) - 1):
+        for pos in range(block_size - (block_size - 1).bit_length() - 1):
             data.append(random.randint(0,1))
         if not test_case(data):
             return False
     return True
 
 
+def random_test_secded(block_size=16, num_tests=100):
+    """ checks that HammingCodec corrects every single error and detects every double error of random blocks """
+    codec = hamming_codec(block_size)
+    for case in range(num_tests):
+        data = [random.randint(0, 1) for pos in range(codec.data_size)]
+        encoded = hamming_encode_block(data, block_size)
+        for i in range(block_size):
+            for j in range(i, block_size):
+                # flip one bit (i == j) or two, see if we decode or detect it, then flip back
+                encoded[i] ^= 1
+                encoded[j] ^= 1 if i != j else 0
+                decoded, status = codec.decode_blocks(encoded)
+                if i == j and (decoded[0].tolist() != data or status[0] != BLOCK_CORRECTED):
+                    return False
+                if i != j and status[0] != BLOCK_DOUBLE_ERROR:
+                    return False
+                encoded[i] ^= 1
+                encoded[j] ^= 1 if i != j else 0
+    return True
+
+
 def hamming_encode_block(data, block_size=16):
     """ encodes data into a message block using the hamming code method
         adds an additional bit to the beginning (0th position) for position convenience, which is the total parity
+        block_size can be any size from 4 up: a power of 2, or a shortened code such as (72, 64)
     """
-    side_length = round(block_size ** 0.5)
-    num_parity_bits = round(math.log2(block_size))  # does not include the total parity bit
-    assert(block_size ** 0.5 == side_length)  # ensure that we have a square block
-    assert(num_parity_bits == math.log2(block_size))  # ensure that block size is a power of 2
+    num_parity_bits = (block_size - 1).bit_length()  # the powers of 2 below block_size, not the total parity bit
 
     message = data.copy()
     # insert zeros into parity bit locations
@@ -127,55 +191,346 @@ def hamming_encode_block(data, block_size=16):
         # just the parity of all the positions that have a 1 in the same binary digit that the parity bit has
         message[2 ** i] = sum([message[j] for j in range(block_size) if j & (2 ** i)]) % 2
     # set the total parity bit
-    message[0] = reduce(lambda x, y: x ^ y, [i for i in range(len(message)) if message[i]])
+    message[0] = sum(message) % 2
 
     return message
 
 
 def hamming_encode(data, block_size=16):
-    num_parity_bits = round(math.log2(block_size))  # does not include the total parity bit
-    data_allocation = block_size - num_parity_bits - 1
-    data = data.copy()
+    """ encodes data into a message of hamming blocks, padding the data with zeros to fill the last block """
+    return hamming_codec(block_size).encode(data).tolist()
 
-    # pad the data with zeros if necessary
-    data += [0 for i in range(len(data) % data_allocation)]
 
-    message = []
-    for i in range(len(data) // data_allocation):
-        message += hamming_encode_block(data[i * data_allocation: (i + 1) * data_allocation])
+def hamming_decode_block(message):
+    """ returns the data from a message block, correcting up to one error """
+    data, status = hamming_codec(len(message)).decode_blocks([message])
+    return data[0].tolist()
 
-    return message
 
+def hamming_decode(message, block_size=16):
+    """ decodes message into data by splitting it into blocks and decoding all the blocks at once """
+    num_blocks = len(message) // block_size
+    return hamming_codec(block_size).decode(message[: num_blocks * block_size]).tolist()
+
+
+class HammingCodec:
+    """ table-driven extended hamming (SECDED) codec for blocks of block_size bits, laid out as by
+        hamming_encode_block: position 0 holds the total parity, the powers of 2 the hamming parity bits, and the
+        remaining positions the data
+        block_size is any size from 4 up: 2^m for a full length code, or anything in between for a shortened one,
+        e.g. 72 for 64 data bits, which fit a uint64 word (see encode_words)
+        the position tables and the generator and parity check matrices are computed once, so encoding and decoding
+        are a few array operations over many blocks at once
+    """
+    def __init__(self, block_size=16):
+        num_parity_bits = (block_size - 1).bit_length()  # the powers of 2 below block_size, not the total parity bit
+        assert(block_size >= 4)  # ensure there is room for a data bit
+
+        self.block_size = block_size
+        self.positions = numpy.arange(block_size)
+        self.parity_positions = 2 ** numpy.arange(num_parity_bits)
+        # positions of the data bits, in the order the data is placed in the block
+        self.data_positions = numpy.array([pos for pos in range(1, block_size) if pos & (pos - 1)])
+        self.data_size = len(self.data_positions)
+
+        # generator matrix: a row of data bits times self.generator (mod 2) is the encoded block.
+        # Row j has the position of data bit j, the hamming parity bits that cover that position, and the total parity
+        # bit if those are an odd number (so that every row, and therefore every block, has even weight)
+        self.generator = numpy.zeros((self.data_size, block_size), dtype=numpy.float32)
+        for j, pos in enumerate(self.data_positions):
+            self.generator[j, pos] = 1
+            self.generator[j, self.parity_positions[(pos & self.parity_positions) != 0]] = 1
+            self.generator[j, 0] = self.generator[j].sum() % 2
+
+        # parity check matrix: a block times self.parity_check (mod 2) gives the bits of the syndrome (the xor of the
+        # positions that hold a 1) in the first num_parity_bits columns, and the total parity in the last one
+        self.parity_check = numpy.zeros((block_size, num_parity_bits + 1), dtype=numpy.float32)
+        self.parity_check[:, :num_parity_bits] = (self.positions[:, None] & self.parity_positions) != 0
+        self.parity_check[:, num_parity_bits] = 1
+
+        # position of the bit to flip for each non-zero syndrome (the xor of the positions that hold a 1), or -1 if the
+        # syndrome does not point into the block (possible for shortened codes, and then more than one bit is wrong)
+        self.correction = numpy.where(numpy.arange(2 ** num_parity_bits) < block_size,
+                                      numpy.arange(2 ** num_parity_bits), -1)
+
+        # tables for blocks of up to 64 data bits held in uint64 words, data bit j being bit j of the word:
+        # self.word_masks[i] selects the data bits covered by the parity bit at position 2^i,
+        # and self.syndrome_flips[syndrome] is the data bit to flip for a syndrome (0 if it is not a data position)
+        if self.data_size <= 64:
+            word_bits = numpy.uint64(1) << numpy.arange(self.data_size, dtype=numpy.uint64)
+            self.data_mask = numpy.bitwise_or.reduce(word_bits)
+            self.word_masks = numpy.array([numpy.bitwise_or.reduce(word_bits[(self.data_positions & pos) != 0])
+                                           for pos in self.parity_positions], dtype=numpy.uint64)
+            self.syndrome_flips = numpy.zeros(2 ** num_parity_bits, dtype=numpy.uint64)
+            self.syndrome_flips[self.data_positions] = word_bits
+
+    def decode_blocks(self, blocks):
+        """ :return (data, status) for blocks, an array (or list) of 1s and 0s that is reshaped to one block per row
+            data holds the data bits of each block (one row per block), with single errors corrected,
+            and status holds BLOCK_OK, BLOCK_CORRECTED or BLOCK_DOUBLE_ERROR for each block
+        """
+        blocks = numpy.array(blocks, dtype=numpy.uint8).reshape(-1, self.block_size)
+
+        # the position of a single error is the xor of all the positions that hold a 1,
+        # and the total parity tells whether there was an odd number of errors
+        checks = _gf2_product(blocks, self.parity_check)
+        syndrome = checks[:, :-1] @ self.parity_positions
+        status = self._status(syndrome, checks[:, -1] == 1)
+
+        # flip the erroneous bit of the correctable blocks
+        fix = numpy.flatnonzero((status == BLOCK_CORRECTED) & (syndrome != 0))
+        blocks[fix, self.correction[syndrome[fix]]] ^= 1
+
+        return blocks[:, self.data_positions], status
+
+    def _status(self, syndrome, odd):
+        """ :return the status of each block from its syndrome and whether its total parity is odd:
+            an odd number of errors is taken to be a single one (an error in the total parity bit itself if the
+            syndrome is 0) unless the syndrome points outside the block, while an even number that leaves a syndrome
+            means two errors
+        """
+        status = numpy.full(len(syndrome), BLOCK_OK)
+        status[odd] = BLOCK_CORRECTED
+        status[(~odd & (syndrome != 0)) | (odd & (self.correction[syndrome] < 0))] = BLOCK_DOUBLE_ERROR
+        return status
+
+    def _word_checks(self, words):
+        """ :return the hamming parity bits of words (uint64 array), bit i being the parity bit at position 2^i """
+        checks = numpy.zeros(words.shape, dtype=numpy.uint8)
+        for i, mask in enumerate(self.word_masks):
+            checks |= parity_array(words & mask) << i
+        return checks
+
+    def encode_words(self, words):
+        """ :return a uint8 array with the check bits of each block of data_size (at most 64) data bits held in words,
+            an array of uint64 (data bit j of a block being bit j of its word, and higher bits being ignored)
+            bit i of a check byte is the parity bit at position 2^i of the block, and the bit above those is the total
+            parity, so a word and its check byte hold the same bits as the block from encode_blocks
+            the parities are computed for all the words at once with one popcount per parity bit
+        """
+        words = numpy.asarray(words, dtype=numpy.uint64) & self.data_mask
+        checks = self._word_checks(words)
+        total = (popcount_array(words) + popcount_array(checks)) & 1
+        return checks | (total << len(self.parity_positions)).astype(numpy.uint8)
+
+    def decode_words(self, words, checks):
+        """ :return (words, status) for the data words and check bytes from encode_words, with single errors corrected
+            in the words, and status as in decode_blocks
+        """
+        words = numpy.asarray(words, dtype=numpy.uint64) & self.data_mask
+        checks = numpy.asarray(checks, dtype=numpy.uint8)
+        syndrome = (checks ^ self._word_checks(words)) & ((1 << len(self.parity_positions)) - 1)
+        odd = (popcount_array(words) + popcount_array(checks)) & 1 == 1
+        status = self._status(syndrome, odd)
+
+        flips = numpy.where(status == BLOCK_CORRECTED, self.syndrome_flips[syndrome], numpy.uint64(0))
+        return words ^ flips, status
+
+    def encode_blocks(self, data):
+        """ :return an array with one encoded block per row, for data: an array of 1s and 0s that is reshaped to
+            data_size bits per row
+        """
+        data = numpy.asarray(data, dtype=numpy.uint8).reshape(-1, self.data_size)
+        return _gf2_product(data, self.generator)
+
+    def encode(self, data):
+        """ :return a flat uint8 array of the blocks encoding data (an array or list of 1s and 0s), which is padded
+            with zeros to a whole number of blocks
+        """
+        return self.encode_blocks(_pad_blocks(data, self.data_size)).reshape(-1)
+
+    def decode(self, message):
+        """ :return a flat uint8 array of the data in message (a whole number of blocks), correcting single errors """
+        data, status = self.decode_blocks(message)
+        return data.reshape(-1)
+
+    def encode_bytes(self, buf):
+        """ :return the encoded blocks of the bits of buf (bytes, bytearray, memoryview or uint8 array) packed into
+            bytes, see bytes_to_bits and bits_to_bytes for the bit order
+        """
+        return bits_to_bytes(self.encode(bytes_to_bits(buf)))
+
+    def decode_bytes(self, buf, length=None):
+        """ :return (data, status) for buf, the output of encode_bytes: data is the decoded bytes with single errors
+            corrected, cut to length bytes if given (else to the whole bytes decoded, which may include padding),
+            and status the per-block status array of decode_blocks
+        """
+        bits = bytes_to_bits(buf)
+        num_blocks = _num_blocks(len(bits), self.block_size, self.data_size, length)
+        data, status = self.decode_blocks(bits[: num_blocks * self.block_size])
+        return bits_to_bytes(data, length), status
+
+
+def _gf2_product(a, b):
+    """ :return the matrix product of the 0/1 arrays a and b over GF(2), as uint8
+        b is float32 so the product runs in BLAS, which is exact as long as the sums stay below 2^24
+    """
+    return (a.astype(numpy.float32) @ b).astype(numpy.uint32).astype(numpy.uint8) & 1
 
-def hamming_decode_block(message):
-    """ returns the data from a message block, correcting up to one error """
 
-    num_parity_bits = round(math.log2(len(message)))
-    # find the position of the error (assuming at most one) by parity checking all groups at once
-    # this is the xor of all the positions that hold a 1 in the message
-    error_pos = reduce(lambda x, y: x ^ y, [i for i in range(len(message)) if message[i]])
-    data = message.copy()
+def bytes_to_bits(buf):
+    """ :return a uint8 array of the bits of buf (bytes, bytearray, memoryview or any array, taken as raw bytes),
+        most significant bit of each byte first
+    """
+    if isinstance(buf, numpy.ndarray):
+        return numpy.unpackbits(numpy.ascontiguousarray(buf).reshape(-1).view(numpy.uint8))
+    return numpy.unpackbits(numpy.frombuffer(buf, dtype=numpy.uint8))
 
-    # flip the error (or the 0 pos bit if no error)
-    data[error_pos] ^= 1
 
-    # remove the parity bits (backwards so that removing a position does not change earlier positions)
-    for i in range(num_parity_bits - 1, -1, -1):
-        data.pop(2 ** i)
-    data.pop(0)
+def bits_to_bytes(bits, length=None):
+    """ :return bytes with the bits (array of 1s and 0s) packed 8 to a byte, most significant bit first,
+        padding the last byte with zeros, and cut to length bytes if given
+    """
+    packed = numpy.packbits(numpy.asarray(bits, dtype=numpy.uint8).reshape(-1))
+    return packed[:length].tobytes()
 
-    return data
 
+def _num_blocks(num_bits, block_len, data_len, length=None):
+    """ :return the number of blocks of block_len bits in num_bits bits of packed codewords, which are the encoding
+        of length bytes (data_len bits per block) if length is given
+    """
+    if length is None:
+        return num_bits // block_len
+    return -(-length * 8 // data_len)
+
+
+def _pad_blocks(bits, block_len):
+    """ :return the bits (an array of 1s and 0s) padded with zeros to a whole number of rows of block_len bits """
+    bits = numpy.asarray(bits, dtype=numpy.uint8).reshape(-1)
+    padded = numpy.zeros(-(-len(bits) // block_len) * block_len, dtype=numpy.uint8)
+    padded[: len(bits)] = bits
+    return padded.reshape(-1, block_len)
+
+
+def rect_parity_encode_bytes(buf, num_rows, num_cols):
+    """ :return the rectangular parity codewords (laid out as by rect_parity_encode) of the bits of buf, packed into
+        bytes, the data being padded with zeros to a whole number of codewords
+    """
+    return rect_parity_codec(num_rows, num_cols).encode_bytes(buf)
 
-def hamming_decode(message, block_size=16):
-    """ decodes message into data by first splitting into blocks and decoding each block """
-    data = []
-    for i in range(len(message) // block_size):
-        data += hamming_decode_block(message[i * block_size: (i+1) * block_size])
 
+def rect_parity_decode_bytes(buf, num_rows, num_cols, length=None):
+    """ :return the data bytes in buf, the output of rect_parity_encode_bytes, correcting up to one error per codeword
+        like rect_parity_decode does, and cut to length bytes if given
+    """
+    data, status = rect_parity_codec(num_rows, num_cols).decode_bytes(buf, length)
     return data
 
 
+@lru_cache(maxsize=None)
+def hamming_codec(block_size=16):
+    """ :return the (shared) HammingCodec for block_size """
+    return HammingCodec(block_size)
+
+
+def status_counts(status):
+    """ :return a dict of the form {"ok": blocks, "corrected": blocks, "double_error": blocks}
+        from the status array of HammingCodec.decode_blocks or RectParityCodec.decode_blocks
+    """
+    counts = numpy.bincount(status, minlength=3)
+    return {"ok": int(counts[BLOCK_OK]),
+            "corrected": int(counts[BLOCK_CORRECTED]),
+            "double_error": int(counts[BLOCK_DOUBLE_ERROR])}
+
+
+class BlockInterleaver:
+    """ interleaves groups of depth consecutive blocks of block_size bits: each group is sent one bit position at a
+        time (bit 0 of each of its blocks, then bit 1 of each, ...), so that a burst of up to depth consecutive errors
+        on the channel hits each block at most once and can be corrected by a single-error-correcting block code
+        a message whose number of blocks is not a multiple of depth ends with a shallower group of the blocks left
+    """
+    def __init__(self, block_size, depth):
+        self.block_size = block_size
+        self.depth = depth
+
+    def interleave_view(self, message):
+        """ :return the full groups of message (an array with a whole number of blocks) as a view of shape
+            (num_groups, block_size, depth), without copying: reading it in C order gives the interleaved bits
+        """
+        message = numpy.asarray(message)
+        num_groups = len(message) // (self.depth * self.block_size)
+        return message[: num_groups * self.depth * self.block_size].reshape(
+            num_groups, self.depth, self.block_size).transpose(0, 2, 1)
+
+    def interleave(self, message):
+        """ :return a flat array of the interleaved message (an array of a whole number of blocks) """
+        return self._shuffle(numpy.asarray(message), self.depth, self.block_size)
+
+    def deinterleave(self, message):
+        """ :return a flat array of message, the output of interleave, in its original order """
+        return self._shuffle(numpy.asarray(message), self.block_size, self.depth, inverse=True)
+
+    def _shuffle(self, message, rows, cols, inverse=False):
+        """ transposes each group of message from rows x cols to cols x rows,
+            the last (shallower) group having rows or cols (the block depth) cut to the blocks left """
+        assert len(message) % self.block_size == 0, "message must be a whole number of blocks"
+        group_size = self.depth * self.block_size
+        full = len(message) // group_size * group_size
+        result = numpy.empty_like(message)
+        result[:full] = message[:full].reshape(-1, rows, cols).transpose(0, 2, 1).reshape(-1)
+
+        left = (len(message) - full) // self.block_size
+        if left:
+            shape = (self.block_size, left) if inverse else (left, self.block_size)
+            result[full:] = message[full:].reshape(shape).T.reshape(-1)
+        return result
+
+
+class StreamingInterleaver:
+    """ interleaves (or with inverse=True, deinterleaves) a continuous stream of bits with a BlockInterleaver:
+        feed takes chunks of any length and returns the output of the groups completed so far,
+        and flush returns the rest at the end of the stream
+    """
+    def __init__(self, interleaver, inverse=False):
+        self.interleaver = interleaver
+        self.inverse = inverse
+        self.pending = numpy.zeros(0, dtype=numpy.uint8)
+
+    def feed(self, chunk):
+        bits = numpy.concatenate((self.pending, numpy.asarray(chunk, dtype=numpy.uint8)))
+        group_size = self.interleaver.depth * self.interleaver.block_size
+        full = len(bits) // group_size * group_size
+        self.pending = bits[full:]
+        return self._shuffle(bits[:full])
+
+    def flush(self):
+        bits, self.pending = self.pending, numpy.zeros(0, dtype=numpy.uint8)
+        return self._shuffle(bits)
+
+    def _shuffle(self, bits):
+        return self.interleaver.deinterleave(bits) if self.inverse else self.interleaver.interleave(bits)
+
+
+def benchmark_interleaver(block_size=64, depth=16, num_bytes=2 ** 20):
+    """ times hamming encoding and decoding of num_bytes random bytes with and without a BlockInterleaver of depth in
+        between, and checks that a burst of depth bit errors is corrected when interleaving
+        returns a dict of the form {step: MB/s}
+    """
+    codec = hamming_codec(block_size)
+    interleaver = BlockInterleaver(block_size, depth)
+    data = bytes_to_bits(numpy.random.randint(0, 256, num_bytes, dtype=numpy.uint8))
+
+    def timed(step, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        throughput[step] = num_bytes / 2 ** 20 / (time.perf_counter() - start)
+        return result
+
+    throughput = {}
+    encoded = timed("encode", codec.encode, data)
+    sent = timed("interleave", interleaver.interleave, encoded)
+    # a burst of depth errors in the middle of the stream
+    burst = len(sent) // 2
+    sent[burst: burst + depth] ^= 1
+    received = timed("deinterleave", interleaver.deinterleave, sent)
+    decoded = timed("decode", codec.decode, received)
+    assert numpy.array_equal(decoded[: len(data)], data), "burst error was not corrected"
+
+    for step, rate in throughput.items():
+        print(f"{step}: {rate:.1f} MB/s")
+    return throughput
+
+
 if __name__ == '__main__':
     pass
 
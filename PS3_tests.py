@@ -1,16 +1,8 @@
-import numpy,operator
-
-# compute hamming distance of two bit sequences
-def hamming(s1,s2):
-    return sum(map(operator.xor,s1,s2))
+import numpy
+from parity import hamming, parity
 
 # xor together all the bits in an integer
-def xorbits(n):
-    result = 0
-    while n > 0:
-        result ^= (n & 1)
-        n >>= 1
-    return result
+xorbits = parity
 
 def expected_parity(from_state,to_state,k,glist):
     # x[n] comes from to_state
@@ -1,7 +1,18 @@
+import heapq
+import random
+import struct
+from collections import Counter, deque
+from itertools import count
+
+import numpy
+
+
 class Node:
     """
     Stores node probability, children, and symbol (None if not a leaf)
     """
+    __slots__ = ("prob", "symbol", "left_child", "right_child")
+
     def __init__(self, probability, symbol = None, left_child = None, right_child = None):
         self.prob = probability
         self.symbol = symbol
@@ -18,10 +29,31 @@ def merge(a, b):
 def tree_mapping(root, prefix = ""):
     """ returns a dict of the form {symbol, binary encoding} from the tree beginning at root
         assumes proper huffman encoding """
-    if root.left_child is None: # in a proper huffman encoding, nodes either have two children or zero
-        return {root.symbol: prefix}
-        
-    return {**tree_mapping(root.left_child, prefix + "0"), **tree_mapping(root.right_child, prefix + "1")}
+    mapping = {}
+    stack = [(root, prefix)] # walked depth first, so the symbols come out left to right
+    while stack:
+        node, node_prefix = stack.pop()
+        if node.left_child is None: # in a proper huffman encoding, nodes either have two children or zero
+            mapping[node.symbol] = node_prefix
+        else:
+            stack.append((node.right_child, node_prefix + "1"))
+            stack.append((node.left_child, node_prefix + "0"))
+    return mapping
+
+
+def code_lengths(root):
+    """ returns a dict of the form {symbol: length of its binary encoding} from the tree beginning at root,
+        in the same order as tree_mapping, without building the encodings """
+    lengths = {}
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if node.left_child is None:
+            lengths[node.symbol] = depth
+        else:
+            stack.append((node.right_child, depth + 1))
+            stack.append((node.left_child, depth + 1))
+    return lengths
 
 
 def code_map(symbols):
@@ -29,26 +61,53 @@ def code_map(symbols):
         generated by huffman algorithm,
         input symbols: dict of the form {symbol, probability of occurrence}
     """
-    nodes = []
-    for symbol, prob in symbols.items():
-        nodes.append(Node(prob, symbol))
+    # the nodes are kept in a heap ordered by probability, and among equal probabilities by when they were made
+    # (symbols in the order given, then merged nodes), so the tree is the same as repeatedly stable sorting a list
+    order = count()
+    nodes = [(prob, next(order), Node(prob, symbol)) for symbol, prob in symbols.items()]
 
     # terminate if no nodes to start with
     if len(nodes) == 0:
         return []
 
-    def get_prob(node):
-        return node.prob
-
+    heapq.heapify(nodes)
     while len(nodes) > 1:
-        nodes.sort(key=get_prob)
-        # remove the two smallest probability nodes from the nodes list
-        a = nodes.pop(0)
-        b = nodes.pop(0)
-        nodes.append(merge(a, b))
+        # remove the two smallest probability nodes from the heap
+        a = heapq.heappop(nodes)[2]
+        b = heapq.heappop(nodes)[2]
+        merged = merge(a, b)
+        heapq.heappush(nodes, (merged.prob, next(order), merged))
 
     # the last node that was a merging (now nodes[0]) forms the tree root
-    return tree_mapping(nodes[0]), nodes[0]
+    root = nodes[0][2]
+    return tree_mapping(root), root
+
+
+def code_map_sorted(symbols):
+    """ code_map in linear time for symbols already ordered by increasing probability
+        the leaves and the merged nodes (which are made in increasing probability) are kept in two queues, and the
+        two smallest nodes are always at their fronts; ties go to the leaves, so the result is the same as code_map's
+    """
+    leaves = deque(Node(prob, symbol) for symbol, prob in symbols.items())
+    if len(leaves) == 0:
+        return []
+    if any(a.prob > b.prob for a, b in zip(leaves, list(leaves)[1:])):
+        raise ValueError("symbols are not ordered by increasing probability")
+
+    merged = deque()
+
+    def pop_smallest():
+        if not merged or (leaves and leaves[0].prob <= merged[0].prob):
+            return leaves.popleft()
+        return merged.popleft()
+
+    while len(leaves) + len(merged) > 1:
+        a = pop_smallest()
+        b = pop_smallest()
+        merged.append(merge(a, b))
+
+    root = (merged or leaves)[0]
+    return tree_mapping(root), root
 
 
 def encode(text, code, code_symbol_seq_len=1):
@@ -69,9 +128,236 @@ def encode(text, code, code_symbol_seq_len=1):
     return "".join(encoding)
 
 
+class BitWriter:
+    """ packs codes into bytes, most significant bit first, through an int accumulator
+        the bytes are kept in buffer, or if a binary file object f is given, written to it every buffer_size bytes
+    """
+    def __init__(self, f = None, buffer_size = 2**16):
+        self.f = f
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.acc = 0 # the last nacc bits written, not yet in buffer
+        self.nacc = 0
+        self.nbits = 0 # bits written in all
+
+    def write(self, code, length):
+        """ writes the low length bits of the int code """
+        self.acc = (self.acc << length) | (code & ((1 << length) - 1))
+        self.nacc += length
+        self.nbits += length
+        if self.nacc >= 64:
+            self._spill()
+
+    def write_symbols(self, text, code, code_symbol_seq_len = 1):
+        """ writes the encoding of text as encode would, with code a dict of the form {symbol: str binary encoding}
+            (or of the form {symbol: (int code, code length)}, as from canonical_codes)
+        """
+        codes = {symbol: (int(encoding, 2) if encoding else 0, len(encoding)) if isinstance(encoding, str)
+                 else encoding for symbol, encoding in code.items()}
+        if code_symbol_seq_len > 1:
+            # an incomplete sequence at the end is dropped, as in encode
+            text = map("".join, zip(*[iter(text)] * code_symbol_seq_len))
+
+        acc, nacc, nbits = self.acc, self.nacc, self.nbits
+        for symbol in text:
+            c, length = codes[symbol]
+            acc = (acc << length) | c
+            nacc += length
+            nbits += length
+            if nacc >= 64:
+                self.acc, self.nacc = acc, nacc
+                self._spill()
+                acc, nacc = self.acc, self.nacc
+        self.acc, self.nacc, self.nbits = acc, nacc, nbits
+
+    def _spill(self):
+        """ moves the whole bytes of the accumulator to the buffer, and the buffer to f once it is big enough """
+        nbytes = self.nacc // 8
+        self.nacc -= 8 * nbytes
+        self.buffer += (self.acc >> self.nacc).to_bytes(nbytes, "big")
+        self.acc &= (1 << self.nacc) - 1
+        if self.f is not None and len(self.buffer) >= self.buffer_size:
+            self.f.write(self.buffer)
+            self.buffer.clear()
+
+    def flush(self):
+        """ writes out what is left, padded with 0 bits to a whole byte, and returns the number of bits written """
+        if self.nacc % 8:
+            self.acc <<= 8 - self.nacc % 8
+            self.nacc += 8 - self.nacc % 8
+        self._spill()
+        if self.f is not None:
+            self.f.write(self.buffer)
+            self.buffer.clear()
+        return self.nbits
+
+
+def encode_bytes(text, code, code_symbol_seq_len = 1):
+    """ returns encode's encoding packed into bytes (most significant bit first, padded with 0 bits) and its length
+        in bits, as (bytes, int)
+    """
+    writer = BitWriter()
+    writer.write_symbols(text, code, code_symbol_seq_len)
+    nbits = writer.flush()
+    return bytes(writer.buffer), nbits
+
+
+def encode_file(text, code, f, code_symbol_seq_len = 1):
+    """ writes encode_bytes's bytes to the binary file object f as they are made, and returns the number of bits """
+    writer = BitWriter(f)
+    writer.write_symbols(text, code, code_symbol_seq_len)
+    return writer.flush()
+
+
+def code_arrays(code, alphabet):
+    """ returns the code (a dict of the form {symbol: str binary encoding}) as two arrays indexed by position in
+        alphabet, the codes as uint64 and their lengths as uint8 (0 for symbols without a code)
+    """
+    codes = numpy.zeros(len(alphabet), dtype=numpy.uint64)
+    lengths = numpy.zeros(len(alphabet), dtype=numpy.uint8)
+    for i, symbol in enumerate(alphabet):
+        encoding = code.get(symbol, "")
+        if len(encoding) > 64:
+            raise ValueError(f"the code of {symbol!r} is longer than 64 bits")
+        codes[i] = int(encoding, 2) if encoding else 0
+        lengths[i] = len(encoding)
+    return codes, lengths
+
+
+def encode_array(indices, codes, lengths, chunk_size = 2**16):
+    """ returns the symbols at indices (an int array of positions in the alphabet of code_arrays) encoded into bytes,
+        as encode_bytes does, and the number of bits
+        the codes are packed into big endian uint64 words, chunk_size symbols at a time: the codes starting in the
+        same word are or-ed together with reduceat (they follow each other, and have no bits in common), and the end
+        of the one running over into the next word, if any, is or-ed into that word
+    """
+    indices = numpy.asarray(indices).reshape(-1)
+    nbits = int(lengths[indices].sum(dtype=numpy.int64))
+    words = numpy.zeros(nbits // 64 + 1, dtype=numpy.uint64)
+
+    start = 0
+    for i in range(0, len(indices), chunk_size):
+        chunk = indices[i: i + chunk_size]
+        chunk_lengths = lengths[chunk].astype(numpy.uint64)
+        ends = numpy.cumsum(chunk_lengths, dtype=numpy.uint64) + numpy.uint64(start)
+        starts = ends - chunk_lengths
+        start = int(ends[-1])
+
+        # each code aligned to the top of a word, then moved to its offset in the word it starts in
+        top = codes[chunk] << (numpy.uint64(64) - numpy.maximum(chunk_lengths, 1))
+        top[chunk_lengths == 0] = 0
+        offsets = starts & numpy.uint64(63)
+        word = (starts >> numpy.uint64(6)).astype(numpy.int64)
+
+        first = numpy.flatnonzero(numpy.diff(word, prepend=-1))
+        words[word[first]] |= numpy.bitwise_or.reduceat(top >> offsets, first)
+
+        over = offsets + chunk_lengths > 64
+        words[word[over] + 1] |= top[over] << (numpy.uint64(64) - offsets[over])
+
+    return words.astype(">u8").tobytes()[: (nbits + 7) // 8], nbits
+
+
+class FlatTree:
+    """ a huffman tree as flat arrays indexed by node, the root being node 0: left and right, the children of each
+        node (-1 for leaves), and symbol, the position in symbols of each leaf's symbol (-1 for other nodes)
+        it takes a few bytes per node instead of a Node object, and pickles as a handful of arrays
+    """
+    def __init__(self, left, right, symbol, symbols):
+        self.left = numpy.asarray(left, dtype=numpy.int32)
+        self.right = numpy.asarray(right, dtype=numpy.int32)
+        self.symbol = numpy.asarray(symbol, dtype=numpy.int32)
+        self.symbols = list(symbols)
+
+    @classmethod
+    def from_tree(cls, root):
+        """ returns the FlatTree of the tree beginning at root (e.g. from code_map), its symbols left to right """
+        left, right, symbol, symbols = [-1], [-1], [-1], []
+        nodes = [root]
+        stack = [0] # depth first, so the symbols come out left to right
+        while stack:
+            i = stack.pop()
+            node = nodes[i]
+            if node.left_child is None:
+                symbol[i] = len(symbols)
+                symbols.append(node.symbol)
+            else:
+                left[i], right[i] = len(nodes), len(nodes) + 1
+                nodes += [node.left_child, node.right_child]
+                left += [-1, -1]
+                right += [-1, -1]
+                symbol += [-1, -1]
+                stack += [right[i], left[i]]
+        return cls(left, right, symbol, symbols)
+
+    @classmethod
+    def from_lengths(cls, lengths):
+        """ returns the FlatTree of the canonical code (see canonical_codes) with the code lengths given as a dict of
+            the form {symbol: code length}, e.g. as read by unpack_code_lengths
+        """
+        left, right, symbol = [-1], [-1], [-1]
+        symbols = []
+        for s, (code, length) in canonical_codes(lengths).items():
+            node = 0
+            for shift in range(length - 1, -1, -1):
+                children = right if code >> shift & 1 else left
+                if children[node] < 0:
+                    children[node] = len(left)
+                    left.append(-1)
+                    right.append(-1)
+                    symbol.append(-1)
+                node = children[node]
+            symbol[node] = len(symbols)
+            symbols.append(s)
+        return cls(left, right, symbol, symbols)
+
+    def code_lengths(self):
+        """ returns a dict of the form {symbol: length of its binary encoding}, from which from_lengths rebuilds the
+            same code if the tree is canonical, and otherwise one with the same lengths
+        """
+        lengths = {}
+        left, right, symbol = self.left.tolist(), self.right.tolist(), self.symbol.tolist()
+        stack = [(0, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if left[node] < 0:
+                lengths[self.symbols[symbol[node]]] = depth
+            else:
+                stack.append((right[node], depth + 1))
+                stack.append((left[node], depth + 1))
+        return lengths
+
+    def decode(self, encoding):
+        """ decode on the flat tree """
+        left, right, symbol, symbols = self.left.tolist(), self.right.tolist(), self.symbol.tolist(), self.symbols
+        if left[0] < 0:
+            raise ValueError("a tree of a single symbol has no bits to decode")
+        text = []
+        node = 0
+        for bit in encoding:
+            if bit == "0":
+                node = left[node]
+            elif bit == "1":
+                node = right[node]
+            else:
+                continue
+
+            if node < 0:
+                # the tree is incomplete (e.g. from_lengths of a lone symbol) and has no code for these bits
+                raise ValueError("bits do not match any code")
+            if symbol[node] >= 0:
+                text.append(symbols[symbol[node]])
+                node = 0
+
+        return text
+
+
 def decode(encoding, root):
     """ :return list of symbols (or symbol sequences)
-        using the root node of the binary tree generated from huffman encoding"""
+        using the root node of the binary tree generated from huffman encoding (or its FlatTree)"""
+    if isinstance(root, FlatTree):
+        return root.decode(encoding)
+
     text = []
     current_node = root
     for bit in encoding:
@@ -87,6 +373,390 @@ def decode(encoding, root):
     return text
 
 
+def canonical_codes(lengths):
+    """ returns a dict of the form {symbol: (int code, code length)} of the canonical huffman code with the code
+        lengths given as a dict of the form {symbol: code length} (e.g. from code_lengths)
+        the codes are assigned counting up in order of length, and among equal lengths in order of symbol (so the
+        symbols must be comparable), so the lengths (see pack_code_lengths) are all a decoder needs, whatever order
+        they are given in
+        a lone symbol, whose tree has no branches, gets a length 1 code; symbols of length 0 otherwise get no code
+    """
+    if len(lengths) == 1:
+        lengths = {symbol: 1 for symbol in lengths}
+    order = sorted((length, symbol) for symbol, length in lengths.items() if length > 0)
+
+    codes = {}
+    code = 0
+    previous_length = order[0][0] if order else 0
+    for length, symbol in order:
+        code <<= length - previous_length
+        if code >= 1 << length:
+            raise ValueError("code lengths are too short to give every symbol a code")
+        codes[symbol] = (code, length)
+        code += 1
+        previous_length = length
+    return codes
+
+
+def canonical_code_map(lengths):
+    """ returns canonical_codes as a dict of the form {symbol: str binary encoding}, as from code_map """
+    return {symbol: format(code, f"0{length}b") for symbol, (code, length) in canonical_codes(lengths).items()}
+
+
+def pack_code_lengths(lengths, alphabet):
+    """ returns bytes holding the code length of every symbol of alphabet (0 if it is not in lengths), in order:
+        a byte with the number of bits per length, 4 if all lengths are below 16 (two per byte, high nibble first)
+        and 8 otherwise
+        as in canonical_codes, a lone symbol is given length 1
+    """
+    if len(lengths) == 1:
+        lengths = {symbol: 1 for symbol in lengths}
+    values = [lengths.get(symbol, 0) for symbol in alphabet]
+    unknown = set(lengths) - set(alphabet)
+    if unknown:
+        raise ValueError(f"symbols {sorted(map(repr, unknown))} are not in the alphabet")
+    if max(values, default=0) > 255:
+        raise ValueError("code lengths over 255 bits can not be packed")
+
+    if max(values, default=0) < 16:
+        if len(values) % 2:
+            values.append(0)
+        return bytes([4]) + bytes(values[i] << 4 | values[i + 1] for i in range(0, len(values), 2))
+    return bytes([8]) + bytes(values)
+
+
+def unpack_code_lengths(header, alphabet):
+    """ returns a dict of the form {symbol: code length} of the symbols of alphabet with a code, in alphabet order,
+        and the number of bytes pack_code_lengths took at the start of header
+    """
+    if not header:
+        raise ValueError("code length header is empty")
+    bits = header[0]
+    if bits == 4:
+        size = 1 + (len(alphabet) + 1) // 2
+        values = [length for byte in header[1: size] for length in (byte >> 4, byte & 15)]
+    elif bits == 8:
+        size = 1 + len(alphabet)
+        values = list(header[1: size])
+    else:
+        raise ValueError(f"code length header has {bits} bits per length")
+    if len(header) < size:
+        raise ValueError("code length header is truncated")
+    return {symbol: length for symbol, length in zip(alphabet, values) if length > 0}, size
+
+
+class TableDecoder:
+    """ decodes canonical huffman codes (see canonical_codes) from packed bits, most significant bit first,
+        by looking up table_bits bits at a time in a table of (symbol, code length) instead of walking a tree
+        codes longer than table_bits are looked up in a secondary table for their first table_bits bits, indexed by
+        the next (at most table_bits) bits, and so on for codes longer still
+    """
+    def __init__(self, lengths, table_bits = 10):
+        codes = canonical_codes(lengths)
+        if not codes:
+            raise ValueError("no symbols to decode")
+        self.max_length = max(length for code, length in codes.values())
+        self.table = self._build_table([(symbol, code, length) for symbol, (code, length) in codes.items()], 0,
+                                       table_bits)
+
+    @classmethod
+    def _build_table(cls, codes, skip, table_bits):
+        """ returns (symbols, lengths, subtables, index bits) for the codes (of the form (symbol, code, length)),
+            indexed by the bits after their first skip bits
+            lengths are the full code lengths, and 0 where the code continues in a subtable (or there is none)
+        """
+        bits = min(table_bits, max(length for symbol, code, length in codes) - skip)
+        symbols = [None] * (1 << bits)
+        lengths = [0] * (1 << bits)
+        subtables = [None] * (1 << bits)
+
+        long_codes = {}
+        for symbol, code, length in codes:
+            extra = length - skip
+            code &= (1 << extra) - 1
+            if extra <= bits:
+                start = code << (bits - extra)
+                for i in range(start, start + (1 << (bits - extra))):
+                    symbols[i] = symbol
+                    lengths[i] = length
+            else:
+                long_codes.setdefault(code >> (extra - bits), []).append((symbol, code, length))
+
+        for prefix, group in long_codes.items():
+            subtables[prefix] = cls._build_table(group, skip + bits, table_bits)
+        return symbols, lengths, subtables, bits
+
+    def decode_bytes(self, data, nbits = None):
+        """ returns the list of symbols encoded in the first nbits bits (by default all) of the bytes-like data """
+        data = memoryview(data).cast("B")
+        remaining = 8 * len(data) if nbits is None else nbits
+        if remaining > 8 * len(data):
+            raise ValueError(f"{nbits} bits asked for from {len(data)} bytes")
+
+        max_length = self.max_length
+        primary = self.table
+        symbols, lengths, subtables, table_bits = primary
+        mask = (1 << table_bits) - 1
+        text = []
+        acc = avail = 0 # avail bits not yet decoded are the low bits of acc
+        i = 0
+        while remaining > 0:
+            while avail < max_length and i < len(data):
+                chunk = data[i: i + 8]
+                acc = (acc << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+                avail += 8 * len(chunk)
+                i += len(chunk)
+
+            # past the end of data the bits are taken to be 0
+            index = (acc >> (avail - table_bits) if avail >= table_bits else acc << (table_bits - avail)) & mask
+            length = lengths[index]
+            if length:
+                symbol = symbols[index]
+            else:
+                table, peek = primary, table_bits
+                while not length:
+                    table = table[2][index]
+                    if table is None:
+                        raise ValueError("bits do not match any code")
+                    bits = table[3]
+                    peek += bits
+                    index = (acc >> (avail - peek) if avail >= peek else acc << (peek - avail)) & ((1 << bits) - 1)
+                    length = table[1][index]
+                symbol = table[0][index]
+
+            if length > remaining:
+                raise ValueError("bits end in the middle of a code")
+            text.append(symbol)
+            remaining -= length
+            avail -= length
+            acc &= (1 << avail) - 1
+
+        return text
+
+
+class FrequencyCounter:
+    """ counts symbols, or sequences of n symbols, in data given a chunk at a time
+        bytes-like chunks (and uint8 arrays) are counted with numpy, as ints 0-255 for n = 1 and as n byte bytes
+        objects otherwise; other integer arrays (e.g. the symbol indices encode_array takes) are counted by value, for
+        n = 1 only; other chunks are iterated over, and n str symbols are joined into one as encode joins them
+        the sequences do not overlap (as in encode), and one cut off by the end of a chunk is finished by the next
+    """
+    def __init__(self, n = 1):
+        self.n = n
+        self.byte_counts = numpy.zeros(256, dtype=numpy.int64) # single bytes
+        self.counter = Counter() # everything else
+        self.byte_tail = numpy.zeros(0, dtype=numpy.uint8)
+        self.tail = []
+
+    def update(self, chunk):
+        if isinstance(chunk, numpy.ndarray) and chunk.dtype != numpy.uint8:
+            if not numpy.issubdtype(chunk.dtype, numpy.integer):
+                raise ValueError(f"can not count an array of {chunk.dtype}")
+            if self.n != 1:
+                raise ValueError("sequences of symbols can only be counted in bytes or uint8 arrays")
+            values, counts = numpy.unique(chunk, return_counts=True)
+            self.counter.update({int(value): int(count) for value, count in zip(values, counts)})
+            return
+
+        if isinstance(chunk, (bytes, bytearray, memoryview, numpy.ndarray)):
+            if isinstance(chunk, numpy.ndarray):
+                data = numpy.ascontiguousarray(chunk).reshape(-1)
+            else:
+                data = numpy.frombuffer(memoryview(chunk).cast("B"), dtype=numpy.uint8)
+            if self.n == 1:
+                self.byte_counts += numpy.bincount(data, minlength=256)
+                return
+            data = numpy.concatenate([self.byte_tail, data])
+            end = len(data) - len(data) % self.n
+            self.byte_tail = data[end:]
+            sequences = data[:end].reshape(-1, self.n)
+            if self.n <= 8:
+                # each sequence as one big endian int, so numpy can count them
+                keys = numpy.zeros(len(sequences), dtype=numpy.uint64)
+                for column in sequences.T:
+                    keys = (keys << numpy.uint64(8)) | column
+                values, counts = numpy.unique(keys, return_counts=True)
+                self.counter.update({int(value).to_bytes(self.n, "big"): int(count)
+                                     for value, count in zip(values, counts)})
+            else:
+                self.counter.update(sequence.tobytes() for sequence in sequences)
+            return
+
+        if self.n == 1:
+            self.counter.update(chunk)
+            return
+        symbols = self.tail + list(chunk)
+        end = len(symbols) - len(symbols) % self.n
+        self.tail = symbols[end:]
+        self.counter.update("".join(symbols[i: i + self.n]) for i in range(0, end, self.n))
+
+    def counts(self):
+        """ returns a dict of the form {symbol: number of occurrences} """
+        counts = {int(byte): int(count) for byte, count in enumerate(self.byte_counts) if count}
+        for symbol, count in self.counter.items():
+            counts[symbol] = counts.get(symbol, 0) + count
+        return counts
+
+    def probabilities(self):
+        """ returns a dict of the form {symbol, probability of occurrence}, as code_map takes """
+        counts = self.counts()
+        total = sum(counts.values())
+        return {symbol: count / total for symbol, count in counts.items()}
+
+
+# block-adaptive mode (compress_adaptive): each block is a byte telling which table it uses, either NEW_TABLE followed
+# by the pack_code_lengths header of the table over the byte alphabet, or the position of one of the cached tables the
+# decoder has already seen (most recently used first); then the number of bytes in the block and the number of bits
+# of its code as two little endian uint32, and the code itself
+BYTE_ALPHABET = range(256)
+NEW_TABLE = 255
+BLOCK_HEADER = struct.Struct("<II")
+
+
+def _byte_code_lengths(counts):
+    """ returns the code lengths of the huffman code of the byte counts (an array of 256), as an array of 256 """
+    symbols = {byte: int(count) for byte, count in enumerate(counts) if count}
+    lengths = numpy.zeros(256, dtype=numpy.int64)
+    for byte, length in code_lengths(code_map(symbols)[1]).items():
+        lengths[byte] = max(length, 1) # as in canonical_codes
+    return lengths
+
+
+def _canonical_arrays(lengths):
+    """ returns the canonical codes (as uint64) and lengths (as uint8) of an array of 256 byte code lengths """
+    codes = numpy.zeros(256, dtype=numpy.uint64)
+    for byte, (code, length) in canonical_codes({byte: int(length) for byte, length in enumerate(lengths)
+                                                 if length}).items():
+        codes[byte] = code
+    return codes, lengths.astype(numpy.uint8)
+
+
+def compress_adaptive(data, block_size = 2**16, cache_size = 4):
+    """ returns data (bytes-like) huffman coded with a code rebuilt for each block of block_size bytes
+        a block uses one of the cache_size most recently used tables instead of sending a new one whenever that takes
+        fewer bits in all; as no code beats the entropy, a new table is not even built when a cached one is within
+        the size of a header of it
+    """
+    if not 1 <= cache_size < NEW_TABLE:
+        raise ValueError(f"cache_size must be from 1 to {NEW_TABLE - 1}, not {cache_size}")
+    data = memoryview(data).cast("B")
+    out = bytearray()
+    cache = [] # (lengths, codes, lengths as uint8), most recently used first
+    for start in range(0, len(data), block_size):
+        block = numpy.frombuffer(data[start: start + block_size], dtype=numpy.uint8)
+        counter = FrequencyCounter()
+        counter.update(block)
+        counts = counter.byte_counts
+        used = counts > 0
+        probs = counts[used] / len(block)
+        entropy_bits = float(-(counts[used] * numpy.log2(probs)).sum())
+
+        # the cheapest cached table that has a code for every byte in the block
+        best, best_bits = None, None
+        for i, (lengths, codes, uint8_lengths) in enumerate(cache):
+            if lengths[used].all():
+                bits = 8 + int(counts @ lengths)
+                if best_bits is None or bits < best_bits:
+                    best, best_bits = i, bits
+
+        if best is None or best_bits > entropy_bits + 8 * (1 + len(pack_code_lengths({}, BYTE_ALPHABET))):
+            lengths = _byte_code_lengths(counts)
+            header = pack_code_lengths({byte: int(length) for byte, length in enumerate(lengths) if length},
+                                       BYTE_ALPHABET)
+            if best is None or 8 + 8 * len(header) + int(counts @ lengths) < best_bits:
+                out.append(NEW_TABLE)
+                out += header
+                cache.insert(0, (lengths,) + _canonical_arrays(lengths))
+                del cache[cache_size:]
+                best = None
+
+        if best is not None:
+            out.append(best)
+            cache.insert(0, cache.pop(best))
+
+        lengths, codes, uint8_lengths = cache[0]
+        payload, nbits = encode_array(block, codes, uint8_lengths)
+        out += BLOCK_HEADER.pack(len(block), nbits)
+        out += payload
+    return bytes(out)
+
+
+def decompress_adaptive(data, cache_size = 4):
+    """ returns the bytes compress_adaptive (with the same cache_size) turned into data """
+    data = memoryview(data).cast("B")
+    out = bytearray()
+    cache = [] # TableDecoder, most recently used first
+    i = 0
+    while i < len(data):
+        table = data[i]
+        i += 1
+        if table == NEW_TABLE:
+            lengths, size = unpack_code_lengths(data[i:], BYTE_ALPHABET)
+            i += size
+            cache.insert(0, TableDecoder(lengths))
+            del cache[cache_size:]
+        elif table < len(cache):
+            cache.insert(0, cache.pop(table))
+        else:
+            raise ValueError(f"block uses table {table}, but only {len(cache)} are cached")
+
+        if len(data) - i < BLOCK_HEADER.size:
+            raise ValueError("block header is truncated")
+        nbytes, nbits = BLOCK_HEADER.unpack_from(data, i)
+        i += BLOCK_HEADER.size
+        payload = data[i: i + (nbits + 7) // 8]
+        i += (nbits + 7) // 8
+        block = cache[0].decode_bytes(payload, nbits)
+        if len(block) != nbytes:
+            raise ValueError(f"block decoded to {len(block)} bytes instead of {nbytes}")
+        out += bytes(block)
+    return bytes(out)
+
+
+def random_test_canonical(num_symbols = 20, num_tests = 100):
+    """ checks that random texts go through canonical_code_map, pack_code_lengths (over a shuffled alphabet),
+        unpack_code_lengths and TableDecoder unchanged, with the lengths given in a random order """
+    for case in range(num_tests):
+        symbols = {str(i): random.random() for i in range(random.randint(1, num_symbols))}
+        lengths = code_lengths(code_map(symbols)[1])
+        shuffled = list(lengths.items())
+        random.shuffle(shuffled)
+        code = canonical_code_map(dict(shuffled))
+
+        alphabet = list(symbols) + ["unused"]
+        random.shuffle(alphabet)
+        unpacked, size = unpack_code_lengths(pack_code_lengths(lengths, alphabet), alphabet)
+
+        text = random.choices(list(symbols), k=random.randint(0, 200))
+        data, nbits = encode_bytes(text, code)
+        if TableDecoder(unpacked, random.randint(1, 10)).decode_bytes(data, nbits) != text:
+            return False
+    return True
+
+
+def random_test_flat_tree(num_symbols = 20, num_tests = 100):
+    """ checks that decode gives the same symbols from a FlatTree (from_tree, and from_lengths of the canonical code)
+        as from the Node tree, and that bits no code of an incomplete tree matches raise ValueError """
+    for case in range(num_tests):
+        symbols = {str(i): random.random() for i in range(random.randint(2, num_symbols))}
+        code, root = code_map(symbols)
+        text = random.choices(list(symbols), k=random.randint(0, 200))
+        encoding = encode(text, code)
+        if decode(encoding, FlatTree.from_tree(root)) != decode(encoding, root):
+            return False
+        lengths = code_lengths(root)
+        if decode(encode(text, canonical_code_map(lengths)), FlatTree.from_lengths(lengths)) != text:
+            return False
+
+    for lengths, encoding in (({"a": 1}, "1"), ({"a": 1, "b": 2}, "0110")):
+        try:
+            decode(encoding, FlatTree.from_lengths(lengths))
+            return False
+        except ValueError:
+            pass
+    return True
+
+
 if __name__ == "__main__":
     # test-case symbols is the probability distribution for the sum of two dice rolls
     '''symbols = {"2": 1/36,
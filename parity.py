@@ -0,0 +1,60 @@
+""" Parity, popcount and Hamming distance helpers shared by the coding modules
+    (ConvolutionalCodes, PS3_tests, LinearBlockCodes)
+"""
+import operator
+
+import numpy
+
+# BYTE_POPCOUNT[b] is the number of set bits in the byte b, and BYTE_PARITY[b] their xor
+BYTE_POPCOUNT = numpy.array([bin(b).count("1") for b in range(256)], dtype=numpy.uint8)
+BYTE_PARITY = BYTE_POPCOUNT & 1
+
+
+if hasattr(int, "bit_count"):
+    def popcount(n):
+        """ :return the number of set bits in the non-negative int n """
+        return n.bit_count()
+else:
+    # int.bit_count is new in python 3.10, before that count a byte at a time with the table
+    def popcount(n):
+        """ :return the number of set bits in the non-negative int n """
+        count = 0
+        while n > 0:
+            count += int(BYTE_POPCOUNT[n & 0xff])
+            n >>= 8
+        return count
+
+
+def parity(n):
+    """ :return the xor of all the bits in the non-negative int n (1 if it has an odd number of set bits, else 0) """
+    return popcount(int(n)) & 1
+
+
+def popcount_array(words):
+    """ :return a uint8 array with the number of set bits in each element of words,
+        an array of non-negative (typically unsigned) integers of any shape
+    """
+    words = numpy.asarray(words)
+    if hasattr(numpy, "bitwise_count"):
+        return numpy.bitwise_count(words)
+
+    # older numpy: look up each byte of each word in the table and add them up
+    counts = BYTE_POPCOUNT[numpy.ascontiguousarray(words).reshape(-1).view(numpy.uint8)]
+    return counts.reshape(words.shape + (words.itemsize,)).sum(axis=-1, dtype=numpy.uint8)
+
+
+def parity_array(words):
+    """ :return a uint8 array with the parity of each element of words (see popcount_array) """
+    return popcount_array(words) & 1
+
+
+def hamming(s1, s2):
+    """ :return the hamming distance of two bit sequences (one bit per element) """
+    return sum(map(operator.xor, s1, s2))
+
+
+def hamming_packed(s1, s2, axis=None):
+    """ :return the hamming distance of two bit-packed arrays (e.g. the uint8 output of numpy.packbits, or uint64
+        words), summed over all bits or, with axis, along that axis only
+    """
+    return popcount_array(numpy.bitwise_xor(s1, s2)).sum(axis=axis, dtype=numpy.int64)